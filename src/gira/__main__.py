@@ -4,21 +4,33 @@ import os
 import sys
 import traceback
 from pathlib import Path
+from typing import Optional
 
-from . import AlrightException, __version__, gira, logger
+from . import AlrightException, __version__, daemon, logger, timing
 from . import config as config_parser
 
 
-def main() -> int:
-    """Prepare gira to run with arguments from command line. Return exit code."""
+def _parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Gira - Git Dependencies Analyzer")
-    parser.add_argument(
+    revisions = parser.add_mutually_exclusive_group()
+    revisions.add_argument(
         "-r",
         "--ref",
         type=str,
         help="Diff to specific commit hash/branch/tag. "
         "Otherwise staged/unstaged or last commit is used",
     )
+    revisions.add_argument(
+        "--range",
+        type=str,
+        metavar="A..B",
+        help="Report dependency changes of every commit in range A..B of the repository history",
+    )
+    parser.add_argument(
+        "--per-tag",
+        action="store_true",
+        help="With --range, report changes per tag instead of per commit",
+    )
     parser.add_argument("-c", "--config", type=str)
     parser.add_argument("-v", "--verbose", action="store_true")
     parser.add_argument("--version", action="store_true")
@@ -29,24 +41,121 @@ def main() -> int:
         help="Include observed deps changes even with no tickets",
     )
     parser.add_argument(
-        "-f", "--format", type=str, default="commit", help="Output format: commit, detail, markdown"
+        "--offline",
+        action="store_true",
+        help="Do not fetch repositories nor ask JIRA - use only what is cached",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print how long each stage took (to stderr)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        metavar="FILE",
+        help="Write timings of all stages to FILE as a Chrome trace (see --profile-format)",
+    )
+    parser.add_argument(
+        "--profile-format",
+        type=str,
+        default="chrome",
+        choices=["chrome", "json"],
+        help="Format of --profile: chrome (chrome://tracing, Perfetto) or a JSON list of spans",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        type=str,
+        default="commit",
+        help="Output format: commit, detail, markdown, json, ndjson",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Serve gira commands from this process to keep caches and connections warm",
     )
     parser.add_argument("args", nargs=argparse.REMAINDER)
-    args = parser.parse_args(sys.argv[1:])
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Prepare gira to run with arguments from command line. Return exit code."""
+    argv = sys.argv[1:] if argv is None else argv
+    args = _parser().parse_args(argv)
     if args.version:
         print(__version__)
         return 0
+    if args.daemon:
+        logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.INFO)
+        return daemon.serve(lambda argv: run(_parser().parse_args(argv)))
+
+    # a running daemon does the work for us, otherwise we do it in this process
+    code = daemon.forward(argv)
+    if code is not None:
+        return code
+    return run(args)
+
+
+def find(tickets: list[str], config_path: Optional[str]) -> int:
+    """Print where the current repository shipped the tickets according to the ticket index
+
+    Outside of a repository shipments of all repositories are printed. Return exit code.
+    """
+    import pygit2  # type: ignore
+
+    from . import cache, index, repo
+
+    try:
+        repository: Optional[str] = repo.identity(Path("."))
+    except pygit2.GitError:
+        repository = None
+    try:
+        conf = config_parser.from_file(Path(config_path).resolve() if config_path else None)
+        path = cache.cache_dir(conf.cache.get("dir")) / index.FILENAME
+    except FileNotFoundError:
+        path = cache.cache_dir() / index.FILENAME
+    if not tickets:
+        logger.error("Usage: gira find TICKET...")
+        return 1
+
+    code = 0
+    for ticket in tickets:
+        shipments = index.find(path, ticket, repository)
+        if not shipments:
+            logger.info(f"{ticket} was not reported by gira yet")
+            code = 1
+        for dependency in dict.fromkeys(s.dependency for s in shipments):
+            versions = [s for s in shipments if s.dependency == dependency]
+            hosts = ", ".join(dict.fromkeys(s.host for s in versions if s.host))
+            print(
+                f"{ticket}: {dependency} {versions[0].version}"
+                + (f" (in {hosts})" if hosts else "")
+            )
+    return code
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run gira with parsed command line arguments. Return exit code."""
+    from . import cache, gira  # the heavy lifting (and imports) are not needed by the client
 
     precommit = len(args.args) > 0 and args.args[0] == ".git/COMMIT_EDITMSG"
     stream = sys.stdout
 
-    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, stream=sys.stderr)
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.INFO)
     logging.getLogger("urllib3").setLevel(logging.WARNING)
+    if args.args[:1] == ["find"]:
+        return find(args.args[1:], args.config)
 
     logger.debug(f"Gira {__version__}")
     logger.debug(f"Args: {args}")
+    if args.timings or args.profile:
+        timing.enable()
     try:
         conf = config_parser.from_file(Path(args.config).resolve() if args.config else None)
+        # set on every run as a daemon serves runs with other configurations and environments
+        cache.CACHE_DIR = cache.cache_dir(conf.cache.get("dir"))
         if not conf.observe and not conf.submodules:
             logger.error("No observed dependencies found in gira configuration file")
             return 1
@@ -56,13 +165,17 @@ def main() -> int:
             logger.debug(f"Outputting to commit message file {commit_msg_file}")
             stream = Path(commit_msg_file).open("at", newline="\n")
 
-        gira.gira(
-            conf,
-            format=args.format,
-            stream=stream,
-            ref=args.ref,
-            include_changes_with_no_tickets=args.all,
-        )
+        with timing.span("gira"):
+            gira.gira(
+                conf,
+                format=args.format,
+                stream=stream,
+                ref=args.ref,
+                include_changes_with_no_tickets=args.all,
+                offline=args.offline,
+                revisions=args.range,
+                per_tag=args.per_tag,
+            )
         return 0
     except AlrightException as e:
         logger.info(e)
@@ -75,6 +188,11 @@ def main() -> int:
     finally:
         if precommit:
             stream.close()
+        if args.timings:
+            timing.summary(sys.stderr)
+        if args.profile:
+            timing.dump(Path(args.profile), args.profile_format)
+        timing.disable()
 
 
 if __name__ == "__main__":
@@ -1,20 +1,77 @@
 """cache provides caching of git repositories and basic operations"""
 
+import hashlib
+import json
+import os
+import re
+import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
 
-import pygit2  # type: ignore
+try:
+    import fcntl
+except ImportError:  # Windows - the cache is not locked there
+    fcntl = None  # type: ignore[assignment]
 
-from . import logger, repo
+from . import core, logger, repo, timing
 
-CACHE_DIR = Path(".gira_cache")
 
+def cache_dir(dir: Optional[str] = None) -> Path:
+    """Return the cache directory shared by all projects of the user
 
-def cache(name: str, url: str) -> pygit2.Repository:
-    """Cache a git repository by its url ane name and return a pygit2.Repository object to it"""
-    repo_dir = CACHE_DIR / (name + ".git")
-    if not CACHE_DIR.exists():
-        CACHE_DIR.mkdir()
+    It is $GIRA_CACHE_DIR if set, then the configured `dir` and finally gira in the user cache
+    directory ($XDG_CACHE_HOME or ~/.cache).
+    """
+    if os.environ.get("GIRA_CACHE_DIR"):
+        return Path(os.environ["GIRA_CACHE_DIR"]).expanduser()
+    if dir:
+        return Path(dir).expanduser()
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "gira"
+
+
+CACHE_DIR = cache_dir()
+DEFAULT_JOBS = 4
+DEFAULT_TTL = 3600.0  # seconds between unconditional fetches of a cached repository
+DEFAULT_FILTER = "tree:0"  # partial clone filter - only commits and tags are needed
+
+
+def cache(
+    name: str,
+    url: str,
+    revisions: Iterable[str] = (),
+    ttl: float = DEFAULT_TTL,
+    offline: bool = False,
+    filter: Optional[str] = DEFAULT_FILTER,
+    related: Optional[dict[str, str]] = None,
+) -> repo.Repo:
+    """Cache a git repository by its url ane name and return a repo.Repo object to it
+
+    The cache is keyed by the normalized URL, so names of the same repository share one clone
+    (the names are recorded in its metadata). A new clone borrows objects from an already cached
+    related repository - one with the same name in its URL, e.g. a fork, or a name mapped to it
+    by `related` ({"sdk-zephyr": "zephyr"}) - through git alternates, so shared history is
+    neither fetched nor stored again.
+
+    An existing cache is fetched only when any of `revisions` cannot be resolved locally or
+    when the last fetch is older than `ttl` seconds. Offline, the cache is never fetched.
+    Only the refs of `revisions` are fetched unless they cannot be resolved that way, then all
+    branches and tags are.
+
+    The cache may be shared by concurrent gira runs, so cloning and fetching hold a lock of the
+    repository and a clone appears in the cache only once it is complete.
+
+    New caches are partial clones with the `filter` (git clone --filter) unless it is empty.
+    The default one skips all trees and blobs as walking the history needs just the commits;
+    git fetches missing objects lazily when they are needed after all (pygit2 does not).
+    """
+    family, key = _cache_key(url, related or {})
+    repo_dir = CACHE_DIR / (key + ".git")
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
     # add a protocol and .git suffix if missing
     if "://" not in url and not url.startswith("git@"):
@@ -22,19 +79,420 @@ def cache(name: str, url: str) -> pygit2.Repository:
     if not url.endswith(".git"):
         url = f"{url}.git"
 
+    if offline:
+        if not repo_dir.exists():
+            raise RuntimeError(f"{name} is not cached yet and cannot be cloned offline")
+        return _open(repo_dir)
+
+    with _locked(repo_dir):
+        repository = _update(name, url, repo_dir, family, revisions, ttl, filter)
+        names = _read_metadata(repo_dir).get("names", [])
+        if name not in names:
+            _write_metadata(repo_dir, {"names": sorted([*names, name])})
+        return repository
+
+
+def _cache_key(url: str, related: dict[str, str]) -> tuple[str, str]:
+    """Return (family, key) of a repository URL
+
+    The key identifies the repository regardless of the protocol, user or .git suffix of the
+    URL. It starts with the family - the repository name, or what `related` maps it to - so
+    related cached repositories are found by the prefix.
+    """
+    normalized = re.sub(r"^[a-z+]+://", "", url.strip().lower())
+    normalized = re.sub(r"^[^@/]+@", "", normalized)
+    normalized = re.sub(r"^([^/:]+):(?!\d+/)", r"\1/", normalized)  # scp-like git@host:path
+    normalized = normalized.rstrip("/").removesuffix(".git").rstrip("/")
+    basename = normalized.rsplit("/", 1)[-1] or "repository"
+    family = re.sub(r"[^\w.-]", "_", related.get(basename, basename))
+    return family, f"{family}-{hashlib.sha1(normalized.encode()).hexdigest()[:8]}"
+
+
+def _reference(repo_dir: Path, family: str) -> Optional[Path]:
+    """Return a cached repository of the same family (except `repo_dir`) to borrow objects from"""
+    # the glob matches longer families too (zephyr-tools-* for zephyr)
+    pattern = re.compile(re.escape(family) + r"-[0-9a-f]{8}\.git")
+    # prefer repositories with objects of their own to keep chains of alternates short
+    candidates = sorted(
+        CACHE_DIR.glob(f"{family}-*.git"),
+        key=lambda p: ((p / "objects" / "info" / "alternates").exists(), p.name),
+    )
+    for candidate in candidates:
+        if candidate != repo_dir and pattern.fullmatch(candidate.name):
+            return candidate.resolve()
+    return None
+
+
+def _update(
+    name: str,
+    url: str,
+    repo_dir: Path,
+    family: str,
+    revisions: Iterable[str],
+    ttl: float,
+    filter: Optional[str],
+) -> repo.Repo:
+    """Clone or fetch a cached repository as needed (see cache) - must hold its lock"""
     # use the binary for remote url to avoid issues with ssh keys
     if not repo_dir.exists():
-        logger.debug(f"Cloning {name} with url {url} to {repo_dir}")
-        subprocess.run(
-            ["git", "clone", "--bare", url, str(repo_dir)], check=True, capture_output=True
-        )
+        logger.debug(f"Cloning {name} with url {url} to {repo_dir} (filter {filter})")
+        # clone aside and move the finished clone in place so nobody opens a partial one
+        tmp_dir = repo_dir.with_name(repo_dir.name + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)  # left by an interrupted clone
+        options = [f"--filter={filter}"] if filter else []
+        reference = _reference(repo_dir, family)
+        if reference is not None:
+            logger.debug(f"Borrowing objects of {name} from {reference}")
+            # objects of the reference must not be pruned while another repository uses them
+            _git(reference, "config", "gc.pruneExpire", "never")
+            options += ["--reference-if-able", str(reference)]
+        try:
+            with timing.span("cache.clone", dependency=name):
+                subprocess.run(
+                    ["git", "clone", "--bare", *options, url, str(tmp_dir)],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+            _write_commit_graph(name, tmp_dir, changed_paths=not _treeless(filter))
+            tmp_dir.rename(repo_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        _write_metadata(repo_dir, {"url": url, "filter": filter or None, "fetched": time.time()})
+        return _index_tags(name, repo_dir)
+
+    revisions = [r for r in revisions if r]
+    repository = _open(repo_dir)
+    with repository.lock:  # the handle may be walked by another thread meanwhile (see _open)
+        missing = [r for r in revisions if not repository.has_revision(r)]
+    age = time.time() - _read_metadata(repo_dir).get("fetched", 0)
+    if not missing and age < ttl:
+        logger.debug(f"Not fetching {name} - revisions are cached and fetched {age:.0f}s ago")
+        return repository
+
+    changed_paths = not _treeless(_read_metadata(repo_dir).get("filter"))
+    if revisions and _fetch_revisions(name, repo_dir, revisions):
+        _write_commit_graph(name, repo_dir, changed_paths)
+        _write_metadata(repo_dir, {"url": url, "fetched": time.time()})
+        return _index_tags(name, repo_dir)
+
+    logger.debug(f"Fetching {name} from origin at {repo_dir} (missing {missing})")
+    try:
+        with timing.span("cache.fetch", dependency=name, refs="all"):
+            _git(repo_dir, "fetch", "--prune", "--tags", "origin")
+    except subprocess.CalledProcessError as e:
+        if missing:
+            raise
+        # everything we need is cached already so we can do without the refresh (e.g. offline)
+        stderr = e.stderr.strip() if e.stderr else str(e)
+        logger.warning(f"Fetching {name} failed, using cached revisions: {stderr}")
+        return repository
+    _write_commit_graph(name, repo_dir, changed_paths)
+    _write_metadata(repo_dir, {"url": url, "fetched": time.time()})
+    return _index_tags(name, repo_dir)
+
+
+_repositories: dict[Path, tuple[int, repo.Repo]] = {}
+
+
+def _open(repo_dir: Path) -> repo.Repo:
+    """Open a cached repository - the handles are kept for the life of the process (e.g. daemon)
+
+    libgit2 looks up refs on disk and rescans packs on a miss, so a kept handle sees fetches.
+    A repository removed and cloned again (a different inode) is opened anew. Names of the same
+    repository share a handle across threads, so it is used only while holding its Repo.lock.
+    """
+    path = repo_dir.resolve()
+    inode = path.stat().st_ino
+    if path not in _repositories or _repositories[path][0] != inode:
+        repository = repo.Repo(repo_dir, ref="HEAD", bare=True)
+        tags = _read_metadata(repo_dir).get("tags")
+        if tags is not None:
+            repository.tag_versions = {v: (tag, oid) for v, (tag, oid) in tags.items()}
+        _repositories[path] = (inode, repository)
+    return _repositories[path][1]
+
+
+def _index_tags(name: str, repo_dir: Path) -> repo.Repo:
+    """Index tags of a cached repository by their versions (see Repo.tag_index) after a fetch
+
+    The index is kept in the metadata so versions resolve by a dictionary lookup in later runs.
+    """
+    repository = _open(repo_dir)
+    with repository.lock, timing.span("cache.tag-index", dependency=name):
+        repository.tag_versions = repository.tag_index()
+    _write_metadata(repo_dir, {"tags": repository.tag_versions})
+    return repository
+
+
+@contextmanager
+def _locked(repo_dir: Path) -> Iterator[None]:
+    """Hold an exclusive lock of a cached file or repository (across processes and threads)"""
+    if fcntl is None:
+        yield
+        return
+    with open(repo_dir.with_suffix(".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _treeless(filter: Optional[str]) -> bool:
+    return bool(filter and filter.startswith("tree:"))
+
+
+def _git(repo_dir: Path, *args: str) -> str:
+    # Pass --git-dir explicitly instead of relying on bare-repo discovery via cwd,
+    # which git refuses under `safe.bareRepository = explicit`.
+    return subprocess.run(
+        ["git", "--git-dir", str(repo_dir), *args], check=True, capture_output=True, text=True
+    ).stdout
+
+
+def _fetch_revisions(name: str, repo_dir: Path, revisions: list[str]) -> bool:
+    """Fetch just the refs `revisions` refer to and return whether all of them resolve now
+
+    Names are looked up as tags and branches (also in their tag form, see repo._v2t) with
+    git ls-remote first, as fetching a ref that does not exist fails. Commit hashes are fetched
+    directly and kept reachable under refs/gira/. Tags are not followed, so the fetch
+    transfers only the history of the requested refs. Version constraints (^1.2.3) may match
+    tags that are not fetched yet, so they are left to a fetch of all tags (returns False).
+    """
+    if any(repo.is_constraint(r) for r in revisions):
+        return False
+    refspecs = []
+    names = []
+    for revision in revisions:
+        if re.fullmatch(r"[0-9a-f]{40}", revision):
+            refspecs.append(f"{revision}:refs/gira/{revision}")
+        else:
+            names += [
+                f"refs/{kind}/{n}"
+                for n in {revision, repo._v2t(revision)}
+                for kind in ("tags", "heads")
+            ]
+    try:
+        if names:
+            with timing.span("cache.ls-remote", dependency=name):
+                output = _git(repo_dir, "ls-remote", "origin", *names)
+            found = [line.split("\t")[1] for line in output.splitlines()]
+            refspecs += [f"+{ref}:{ref}" for ref in found if ref in names]
+        if refspecs:
+            logger.debug(f"Fetching {name} refs {refspecs}")
+            with timing.span("cache.fetch", dependency=name, refs=len(refspecs)):
+                _git(repo_dir, "fetch", "--no-tags", "origin", *refspecs)
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.strip() if e.stderr else str(e)
+        logger.debug(f"Fetching revisions {revisions} of {name} failed: {stderr}")
+        return False
+    repository = _open(repo_dir)
+    with repository.lock:
+        return all(repository.has_revision(r) for r in revisions)
+
+
+def _write_commit_graph(name: str, repo_dir: Path, changed_paths: bool = True) -> None:
+    """Write the commit-graph of a cached repository
+
+    The commit-graph stores parents, generation numbers and changed-path Bloom filters of all
+    commits, so history walks and ancestry checks do not need to parse commit objects from
+    packfiles. The graph is written as a single objects/info/commit-graph file, not as a chain
+    of layers (--split), as libgit2 (pygit2) reads only that one. A failure only costs speed and
+    is therefore just logged.
+
+    Bloom filters are computed from trees, so `changed_paths` should be off for treeless partial
+    clones where that would download every tree.
+    """
+    options = ["--changed-paths"] if changed_paths else []
+    try:
+        with timing.span("cache.commit-graph", dependency=name):
+            _git(repo_dir, "commit-graph", "write", "--reachable", *options)
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", None)
+        stderr = stderr.strip() if stderr else str(e)
+        logger.warning(f"Writing commit-graph of {name} failed: {stderr}")
+
+
+def stored_tickets(
+    url: str,
+    old_version: str,
+    new_version: str,
+    pattern: re.Pattern,
+    repository: Optional[repo.Repo] = None,
+    history: Optional[dict[str, Any]] = None,
+    related: Optional[dict[str, str]] = None,
+) -> Optional[list[str]]:
+    """Return tickets extracted by a previous run between two versions of a cached repository
+
+    Results are stored next to the repository cached from `url` (see cache for `related`) and
+    keyed by the commits both versions resolve to, by the ticket pattern and by the `history`
+    options the messages were walked with (see Repo.messages). Without `repository` only
+    versions that previously resolved to tags or commit hashes (which do not move) are looked
+    up, so a hit does not need the repository to be fetched or even opened.
+
+    @throws KeyError if `repository` is given and does not contain any of the versions
+    """
+    store = _read_json(_tickets_path(url, related))
+    if repository is None:
+        oids = _stored_oids(store, old_version, new_version)
     else:
-        logger.debug(f"Fetching {name} from origin at {repo_dir}")
-        # Pass --git-dir explicitly instead of relying on bare-repo discovery via cwd,
-        # which git refuses under `safe.bareRepository = explicit`.
-        subprocess.run(
-            ["git", "--git-dir", str(repo_dir), "fetch", "--prune", "--tags", "origin"],
-            check=True,
-            capture_output=True,
+        oids = [str(c.id) for c in repository.resolve_range(old_version, new_version)]
+    if not oids:
+        return None
+    return store.get("ranges", {}).get("..".join(oids), {}).get(_result_key(pattern, history))
+
+
+def stored_oids(
+    url: str, old_version: str, new_version: str, related: Optional[dict[str, str]] = None
+) -> tuple[Optional[str], Optional[str]]:
+    """Return commits of two versions as stored with their tickets (for tags and hashes only)"""
+    oids = _stored_oids(_read_json(_tickets_path(url, related)), old_version, new_version)
+    return (oids[0], oids[1]) if oids else (None, None)
+
+
+def _stored_oids(store: dict[str, Any], old_version: str, new_version: str) -> Optional[list[str]]:
+    return store.get("versions", {}).get(f"{old_version}..{new_version}")
+
+
+def store_tickets(
+    url: str,
+    repository: repo.Repo,
+    old_version: str,
+    new_version: str,
+    pattern: re.Pattern,
+    tickets: list[str],
+    history: Optional[dict[str, Any]] = None,
+    related: Optional[dict[str, str]] = None,
+) -> None:
+    """Remember tickets found between two versions of a cached repository (see stored_tickets)"""
+    path = _tickets_path(url, related)
+    oids = [str(c.id) for c in repository.resolve_range(old_version, new_version)]
+    key = _result_key(pattern, history)
+    # concurrent runs must not drop each other's results
+    with _locked(path):
+        store = _read_json(path)
+        store.setdefault("ranges", {}).setdefault("..".join(oids), {})[key] = tickets
+        if repository.is_immutable(old_version) and repository.is_immutable(new_version):
+            store.setdefault("versions", {})[f"{old_version}..{new_version}"] = oids
+        _write_json(path, store)
+
+
+def _result_key(pattern: re.Pattern, history: Optional[dict[str, Any]]) -> str:
+    if not history:
+        return pattern.pattern
+    return f"{pattern.pattern} {json.dumps(history, sort_keys=True)}"
+
+
+def _tickets_path(url: str, related: Optional[dict[str, str]]) -> Path:
+    """Tickets of a cached repository live in a JSON file next to the bare repository"""
+    _, key = _cache_key(url, related or {})
+    return CACHE_DIR / (key + ".tickets.json")
+
+
+def _metadata_path(repo_dir: Path) -> Path:
+    """Metadata of a cached repository live in a JSON file next to the bare repository"""
+    return repo_dir.with_suffix(".json")
+
+
+def _read_metadata(repo_dir: Path) -> dict[str, Any]:
+    return _read_json(_metadata_path(repo_dir))
+
+
+def _write_metadata(repo_dir: Path, metadata: dict[str, Any]) -> None:
+    _write_json(_metadata_path(repo_dir), {**_read_metadata(repo_dir), **metadata})
+
+
+def _read_json(path: Path) -> dict[str, Any]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data: dict[str, Any]) -> None:
+    """Write JSON atomically so concurrent readers never see a half-written file"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(data))
+    tmp.replace(path)
+
+
+def submit_all(
+    upgrades: Iterable[core.Upgrade],
+    observe: dict[str, str],
+    jobs: int = DEFAULT_JOBS,
+    ttl: float = DEFAULT_TTL,
+    offline: bool = False,
+    filter: Optional[str] = DEFAULT_FILTER,
+    related: Optional[dict[str, str]] = None,
+    **_: Any,
+) -> dict[str, Future]:
+    """Start caching repositories of all upgrades in the background, return {name: Future[Repo]}
+
+    The repository URL is taken from the observed dependencies, falling back to the URL found
+    in the dependency file itself - names without any URL are missing in the result. At most
+    `jobs` clones/fetches run at the same time. Every future resolves as soon as its repository
+    is cached; a failure is logged and set as the exception of the future.
+    Names with the same repository are fetched once and related repositories (see cache) one
+    after another so that they can share objects.
+    """
+    related = related or {}
+    # family -> key -> {name: url} and key -> revisions of all its names
+    families: dict[str, dict[str, dict[str, str]]] = {}
+    revisions: dict[str, set[str]] = {}
+    for upgrade in upgrades:
+        url = observe.get(upgrade.name) or upgrade.repository
+        if not url:
+            logger.warning(f"Cannot get repository URL of {upgrade.name} from anywhere")
+            continue
+        family, key = _cache_key(url, related)
+        families.setdefault(family, {}).setdefault(key, {})[upgrade.name] = url
+        revisions.setdefault(key, set()).update(
+            v for v in (upgrade.old_version, upgrade.new_version) if v
         )
-    return repo.Repo(repo_dir, ref="HEAD", bare=True)
+
+    futures: dict[str, Future] = {
+        name: Future() for keys in families.values() for urls in keys.values() for name in urls
+    }
+
+    def cache_family(keys: dict[str, dict[str, str]]) -> None:
+        for key, urls in keys.items():
+            # names of the same repository share its failure, other family members still try
+            failure: Optional[Exception] = None
+            for name, url in urls.items():
+                if failure is not None:
+                    futures[name].set_exception(failure)
+                    continue
+                try:
+                    # only the first name fetches, the others find everything cached
+                    futures[name].set_result(
+                        cache(name, url, revisions[key], float(ttl), offline, filter, related)
+                    )
+                except subprocess.CalledProcessError as e:
+                    stderr = e.stderr.strip() if e.stderr else ""
+                    logger.error(f"Caching {name} from {url} failed: {stderr or e}")
+                    failure = e
+                    futures[name].set_exception(e)
+                except Exception as e:
+                    logger.error(f"Caching {name} from {url} failed: {e.__class__.__name__}: {e}")
+                    failure = e
+                    futures[name].set_exception(e)
+
+    if families:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(int(jobs), len(families))))
+        for keys in families.values():
+            executor.submit(cache_family, keys)
+        executor.shutdown(wait=False)  # the submitted families still run
+    return futures
+
+
+def cache_all(
+    upgrades: Iterable[core.Upgrade], observe: dict[str, str], **options: Any
+) -> dict[str, repo.Repo]:
+    """Cache repositories of all upgrades concurrently and return {name: Repo} of the cached ones
+
+    See submit_all - a failure of one repository is logged and does not stop the others, it is
+    just missing in the result.
+    """
+    futures = submit_all(upgrades, observe, **options)
+    return {name: f.result() for name, f in futures.items() if f.exception() is None}
@@ -1,7 +1,5 @@
 import sys
-from typing import Optional
-
-import yaml
+from typing import Any, Optional
 
 if sys.version_info >= (3, 11):
     import tomllib as toml
@@ -24,24 +22,49 @@ class Config:
     jira: dict[str, str]  # url, user, token
     observe: dict[str, str]  # name -> url
     submodules: bool
-
-    def __init__(self, jira: dict[str, str], observe: dict[str, str], submodules: bool = True):
+    cache: dict[str, Any]  # dir, jobs, ttl, filter, related
+    history: dict[str, Any]  # limit, first_parent
+
+    def __init__(
+        self,
+        jira: dict[str, str],
+        observe: dict[str, str],
+        submodules: bool = True,
+        cache: Optional[dict[str, Any]] = None,
+        history: Optional[dict[str, Any]] = None,
+    ):
         self.jira = jira
         self.observe = observe
         self.submodules = submodules
+        self.cache = cache or {}
+        self.history = history or {}
 
 
 def from_file(path: Optional[Path]) -> Config:
-    """Load configuration file"""
+    """Load configuration file
+
+    Parsed files are kept until they change so a long running process (daemon) reads them once.
+    """
     if path and path.exists():
-        return _parse_file(path)
+        return _parse_cached(path)
 
     if DEFAULT_CONFIG.exists():
-        return _parse_file(DEFAULT_CONFIG)
+        return _parse_cached(DEFAULT_CONFIG)
 
     raise FileNotFoundError("No configuration file found")
 
 
+_parsed: dict[Path, tuple[int, Config]] = {}
+
+
+def _parse_cached(path: Path) -> Config:
+    path = path.resolve()
+    mtime = path.stat().st_mtime_ns
+    if path not in _parsed or _parsed[path][0] != mtime:
+        _parsed[path] = (mtime, _parse_file(path))
+    return _parsed[path][1]
+
+
 def _parse_file(path: Path) -> Config:
     config = Config(jira={}, observe={})
     if path.name == ".gira.yaml":
@@ -64,19 +87,35 @@ def _pytoml(path: Path) -> Config:
         return Config(
             jira=_section(parsed, "tool.gira.jira"),
             observe=_section(parsed, "tool.gira.observe"),
+            cache=_section(parsed, "tool.gira.cache"),
+            history=_section(parsed, "tool.gira.history"),
         )
 
 
 def _conf(path: Path) -> Config:
     """Parse watched dependencies by GIRA from .girarc"""
+    import yaml
+
     parsed = yaml.load(path.read_text(), Loader=yaml.SafeLoader)
-    return Config(jira=_section(parsed, "jira"), observe=_section(parsed, "observe"))
+    return Config(
+        jira=_section(parsed, "jira"),
+        observe=_section(parsed, "observe"),
+        cache=_section(parsed, "cache"),
+        history=_section(parsed, "history"),
+    )
 
 
 def _generic_yaml(path: Path) -> Config:
     """Parse watched dependencies by GIRA from generic YAML"""
+    import yaml
+
     parsed = yaml.load(path.read_text(), Loader=yaml.SafeLoader)
-    return Config(jira=_section(parsed, "gira.jira"), observe=_section(parsed, "gira.observe"))
+    return Config(
+        jira=_section(parsed, "gira.jira"),
+        observe=_section(parsed, "gira.observe"),
+        cache=_section(parsed, "gira.cache"),
+        history=_section(parsed, "gira.history"),
+    )
 
 
 def _section(d: Optional[dict], path: str) -> dict:
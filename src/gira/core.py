@@ -1,5 +1,8 @@
-from dataclasses import dataclass, field
-from typing import Optional
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from .jira import Ticket
 
 
 @dataclass(order=False, frozen=False)
@@ -29,6 +32,33 @@ class Upgrade:
     new_version: Optional[str] = None
     repository: Optional[str] = None
     messages: Optional[list[str]] = None
+    tickets: Optional[list[str]] = None
+    old_oid: Optional[str] = None  # commits the versions resolve to (if known)
+    new_oid: Optional[str] = None
+    # ticket -> (tag, commit) of the first version containing it, if known
+    first_tags: dict[str, tuple[str, str]] = field(default_factory=dict)
+    timings: dict[str, float] = field(default_factory=dict)  # seconds spent per stage
 
     def __str__(self):
         return f"{self.name} {self.old_version} => {self.new_version}:"
+
+
+@dataclass(order=False, frozen=False)
+class Result:
+    """Reported dependency change with its tickets"""
+
+    upgrade: Upgrade
+    tickets: list["Ticket"]
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the result as plain data (for JSON) - the change without its commit messages"""
+        return {
+            "name": self.upgrade.name,
+            "old_version": self.upgrade.old_version,
+            "new_version": self.upgrade.new_version,
+            "old_oid": self.upgrade.old_oid,
+            "new_oid": self.upgrade.new_oid,
+            "repository": self.upgrade.repository,
+            "tickets": [asdict(t) for t in self.tickets],
+            "timings": self.upgrade.timings,
+        }
@@ -0,0 +1,173 @@
+"""daemon runs gira in a long-lived process serving the gira command over a Unix socket
+
+Started with `gira --daemon`, it keeps what runs can share warm - imported modules, parsed
+configuration, open cached repositories and Jira connections. While it runs, the gira command
+only forwards its arguments, working directory and git/gira environment to it and prints the
+answer. Without a daemon the command runs in its own process as usual.
+
+Requests are served one at a time as a run changes the working directory and environment.
+"""
+
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from . import __version__, logger
+
+# variables of the client that runs depend on - git sets GIT_INDEX_FILE etc. in hooks
+FORWARDED_ENV = ("GIT_", "GIRA_", "JIRA_")
+
+
+def socket_path() -> Path:
+    """Return $GIRA_SOCKET or gira-<uid>.sock in $XDG_RUNTIME_DIR
+
+    Without a runtime directory the socket goes to a gira-<uid> directory of the temporary
+    directory, which the daemon creates accessible to the user only.
+    """
+    if os.environ.get("GIRA_SOCKET"):
+        return Path(os.environ["GIRA_SOCKET"])
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(os.environ["XDG_RUNTIME_DIR"]) / f"gira-{os.getuid()}.sock"
+    return Path(tempfile.gettempdir()) / f"gira-{os.getuid()}" / "gira.sock"
+
+
+def is_private(path: Path) -> bool:
+    """Return True if the socket (or directory) and its directory belong to the user
+
+    The directory must not be writable by others either, so nobody else can put a socket of
+    theirs in place - the environment sent to the daemon contains JIRA credentials.
+    """
+    try:
+        directory = os.stat(path.parent)
+        owners = {directory.st_uid} | ({os.stat(path).st_uid} if path.exists() else set())
+    except OSError:
+        return False
+    return owners == {os.getuid()} and not directory.st_mode & 0o022
+
+
+def forward(argv: list[str], path: Optional[Path] = None) -> Optional[int]:
+    """Run gira with `argv` in the daemon and return its exit code, None if no daemon runs"""
+    path = path or socket_path()
+    if not path.exists():
+        return None
+    if not is_private(path):
+        logger.warning(f"Gira daemon socket {path} is not private to the user - running in-process")
+        return None
+    request = {
+        "version": __version__,
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": {k: v for k, v in os.environ.items() if k.startswith(FORWARDED_ENV)},
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(path))
+            client.sendall(json.dumps(request).encode() + b"\n")
+            client.shutdown(socket.SHUT_WR)
+            response = json.loads(client.makefile("rb").read())
+    except (OSError, ValueError) as e:
+        logger.debug(f"Gira daemon at {path} is not usable ({e}) - running in-process")
+        return None
+    if "code" not in response:
+        logger.debug(f"Gira daemon refused the run: {response.get('error')} - running in-process")
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["code"]
+
+
+class _CurrentStderr(logging.StreamHandler):
+    """Log to what sys.stderr is at the moment - it is redirected to the client in every run"""
+
+    @property  # type: ignore[override]
+    def stream(self) -> Any:
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, _: Any) -> None:
+        pass
+
+
+class Server(socketserver.UnixStreamServer):
+    """Serve runs of gira - `run` takes the command line arguments and returns the exit code"""
+
+    def __init__(self, path: Path, run: Callable[[list[str]], int]):
+        self.run = run
+        super().__init__(str(path), _Handler)
+
+    def answer(self, request: dict[str, Any]) -> dict[str, Any]:
+        if request.get("version") != __version__:
+            return {"error": f"the daemon runs gira {__version__}"}
+        logger.info(f"Running gira {' '.join(request['argv'])} in {request['cwd']}")
+        cwd = os.getcwd()
+        env = dict(os.environ)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        try:
+            os.chdir(request["cwd"])
+            for name in [n for n in os.environ if n.startswith(FORWARDED_ENV)]:
+                del os.environ[name]
+            os.environ.update(request["env"])
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    code = self.run(request["argv"])
+                except SystemExit as e:  # e.g. invalid arguments
+                    code = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            return {"error": f"{e.__class__.__name__}: {e}"}
+        finally:
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+        return {"code": code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: Server
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.read())
+        except ValueError:
+            return
+        self.wfile.write(json.dumps(self.server.answer(request)).encode())
+
+
+def serve(run: Callable[[list[str]], int], path: Optional[Path] = None) -> int:
+    """Serve runs of gira on the Unix socket `path` until interrupted or terminated"""
+    path = path or socket_path()
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not is_private(path):
+        logger.error(f"Gira daemon socket {path} or its directory is not private to the user")
+        return 1
+    if path.exists():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            if probe.connect_ex(str(path)) == 0:
+                logger.error(f"Gira daemon is already running at {path}")
+                return 1
+        path.unlink()  # left by a daemon that did not exit cleanly
+
+    logging.getLogger().addHandler(_CurrentStderr())
+    umask = os.umask(0o177)  # only the user may connect
+    try:
+        server = Server(path, run)
+    finally:
+        os.umask(umask)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    logger.info(f"Gira daemon listening at {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+    return 0
@@ -3,10 +3,9 @@
 import re
 import tomllib as toml
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Optional
-
-import yaml
+from typing import Any, Callable, Optional
 
 from . import logger
 
@@ -17,6 +16,13 @@ PUBSPEC_PATTERN = re.compile(r"pubspec.*\.ya?ml")
 WEST_PATTERN = re.compile(r"west.*\.ya?ml")
 REQUIREMENTS_PATTERN = re.compile(r"requirements.*\.txt")
 
+# kas files are recognized by their top-level keys which must appear in the first bytes
+KAS_SCAN_BYTES = 64 * 1024
+KAS_KEYS_RE = re.compile(rb"^header[ \t]*:", re.MULTILINE)
+
+# filename globs covering every file some parser above may accept (KAS can be any YAML file)
+FILENAME_GLOBS = ["pyproject.toml", "requirements*.txt", "*.yml", "*.yaml"]
+
 
 @dataclass
 class Dependency:
@@ -31,19 +37,32 @@ class Dependency:
         return isinstance(value, Dependency) and value.name == self.name
 
 
-def is_parsable(filepath: Path) -> bool:
-    """Extract changes in observed dependencies from dependency/lock files diffs"""
+def is_parsable(filepath: Path, content: Optional[str] = None) -> bool:
+    """Extract changes in observed dependencies from dependency/lock files diffs
+
+    KAS files are recognized by `content` if given (e.g. of a commit), else by the file itself.
+    """
     return (
         filepath.name == PYTOML_FILENAME
         or PUBSPEC_PATTERN.match(filepath.name) is not None
         or WEST_PATTERN.match(filepath.name) is not None
         or REQUIREMENTS_PATTERN.match(filepath.name) is not None
-        or is_kas_yaml(filepath)
+        or is_kas_yaml(filepath, content)
     )
 
 
-def parse(path: Path, content: str, observed: dict[str, str]) -> dict[str, Dependency]:
-    """Return dictionary with {dependency: version} items"""
+def parse(
+    path: Path,
+    content: str,
+    observed: dict[str, str],
+    documents: Optional["KasDocuments"] = None,
+) -> dict[str, Dependency]:
+    """Return dictionary with {dependency: version} items
+
+    KAS files are recognized by their content; their includes are resolved through
+    `documents` - the KAS documents of the same revision as `content`. YAML that is not a KAS
+    document (e.g. in a revision before or after the file was one) has no dependencies.
+    """
     if path.name == PYTOML_FILENAME:
         return parse_pytoml(content, observed)
     if PUBSPEC_PATTERN.match(path.name) is not None:
@@ -52,6 +71,11 @@ def parse(path: Path, content: str, observed: dict[str, str]) -> dict[str, Depen
         return parse_west_yaml(content, observed)
     if REQUIREMENTS_PATTERN.match(path.name) is not None:
         return parse_requirements(content, observed)
+    if path.suffix in (".yml", ".yaml"):
+        document = load_yaml(content)
+        if not _is_kas_document(document):
+            return {}  # the file does not exist in this revision or is no KAS document
+        return parse_kas_yaml(content, observed, path, documents)
     raise NotImplementedError(f"No dependency parser for {path.name}")
 
 
@@ -194,7 +218,7 @@ def parse_pubspec_yaml(content: str, observed: dict[str, str]) -> dict[str, Depe
           hive: ^2.0.4
     """
     dependencies: dict[str, Dependency] = {}
-    parsed = yaml.load(content, Loader=yaml.SafeLoader)
+    parsed = load_yaml(content)
     if not parsed or "dependencies" not in parsed:
         logger.warning("pubspec.yaml is empty or does not contain dependencies")
         return dependencies
@@ -243,7 +267,7 @@ def parse_west_yaml(content: str, observed: dict[str, str]) -> dict[str, Depende
               revision: 963065664406bad9a1b9c985a10f038952397b78
     """
     dependencies: dict[str, Dependency] = {}
-    parsed = yaml.load(content, Loader=yaml.SafeLoader)
+    parsed = load_yaml(content)
     if not parsed or "manifest" not in parsed:
         logger.warning("WEST is empty or does not contain dependencies")
         return dependencies
@@ -263,25 +287,105 @@ def parse_west_yaml(content: str, observed: dict[str, str]) -> dict[str, Depende
     return dependencies
 
 
-def is_kas_yaml(path: Path) -> bool:
+def is_kas_yaml(path: Path, content: Optional[str] = None) -> bool:
+    """Return True if the YAML file at `path` (or its `content` if given) is a KAS document"""
     if path.suffix not in (".yml", ".yaml"):
         return False
     try:
-        data = yaml.load(path.read_bytes(), Loader=yaml.SafeLoader)
-        if not isinstance(data, dict):
+        # cheap prefilter so CI/k8s YAML files are not parsed just to be thrown away
+        if content is None:
+            with path.open("rb") as f:
+                if KAS_KEYS_RE.search(f.read(KAS_SCAN_BYTES)) is None:
+                    return False
+            content = path.read_text()
+        elif KAS_KEYS_RE.search(content[:KAS_SCAN_BYTES].encode()) is None:
             return False
-        # kas needs to have 'header' and 'repos' to be of our interest
-        return "header" in data and "repos" in data
+        return _is_kas_document(load_yaml(content))
     except Exception as e:
         logger.warning("Parsing of %s failed with %s", str(path), str(e))
     return False
 
 
-def parse_kas_yaml(content: str, observed: dict[str, str]) -> dict[str, Dependency]:
+def _is_kas_document(data: Any) -> bool:
+    """kas needs to have 'header' and 'repos' (its own or included) to be of our interest"""
+    return (
+        isinstance(data, dict)
+        and isinstance(data.get("header"), dict)
+        and ("repos" in data or "includes" in data["header"])
+    )
+
+
+@lru_cache(maxsize=256)
+def load_yaml(content: str) -> Any:
+    """Parse YAML content once - the same document is checked by is_kas_yaml and parsed later
+
+    The returned document is shared so it must not be modified.
+    """
+    import yaml  # only runs with a changed YAML file need it
+
+    return yaml.load(content, Loader=yaml.SafeLoader)
+
+
+class KasDocuments:
+    """KAS documents of one revision with their includes resolved, each file read only once
+
+    Includes are followed recursively and merged the way kas does it - dictionaries are merged
+    recursively, the including document wins. Included paths are relative to the repository
+    root, `load` returns the content of such a path in the revision (empty if it is missing).
+    Includes from other repositories (`repo: ..., file: ...`) are not followed.
+    """
+
+    def __init__(self, load: Callable[[Path], str]):
+        self._load = load
+        self._documents: dict[Path, dict[str, Any]] = {}
+
+    def resolve(self, path: Path, content: Optional[str] = None) -> dict[str, Any]:
+        """Return document at `path` merged over all documents it includes"""
+        if path in self._documents:
+            return self._documents[path]
+        self._documents[path] = {}  # stops include cycles
+        if content is None:
+            try:
+                content = self._load(path)
+            except (OSError, RuntimeError) as e:
+                logger.warning(f"KAS include {path} cannot be read: {e}")
+                content = ""
+        document = load_yaml(content) if content else None
+        if not isinstance(document, dict):
+            return {}
+
+        merged: dict[str, Any] = {}
+        header = document.get("header")
+        for include in (header.get("includes") if isinstance(header, dict) else None) or []:
+            if isinstance(include, str):
+                merged = _merge(merged, self.resolve(Path(include)))
+            else:
+                logger.debug(f"Not following include {include} of {path} from another repo")
+        self._documents[path] = _merge(merged, document)
+        return self._documents[path]
+
+
+def _merge(base: dict[str, Any], override: dict[str, Any]) -> dict[str, Any]:
+    """Merge dictionaries recursively into a new one - values of `override` win"""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def parse_kas_yaml(
+    content: str,
+    observed: dict[str, str],
+    path: Optional[Path] = None,
+    documents: Optional[KasDocuments] = None,
+) -> dict[str, Dependency]:
     """Extracts first-order dependencies recursively from a KAS yaml.
 
         Beware that repos without commit hashes are local thus they are not dependencies
-        and will be skipped by gira.
+        and will be skipped by gira. Includes are followed only with `path` and `documents`.
 
         Example:
             header:
@@ -309,21 +413,24 @@ def parse_kas_yaml(content: str, observed: dict[str, str]) -> dict[str, Dependen
                         meta-dt-mender:
     """
     dependencies: dict[str, Dependency] = {}
-    parsed = yaml.load(content, Loader=yaml.SafeLoader)
+    if path is not None and documents is not None:
+        parsed = documents.resolve(path, content)
+    else:
+        parsed = load_yaml(content)
     if not parsed or "repos" not in parsed:
         logger.warning("KAS does not contain 'repos'")
         return dependencies
 
-    repos: dict[str, dict[str, Any]] = parsed.get("repos", {})
-    for repo_name in repos:
+    repos: dict[str, Any] = parsed.get("repos") or {}
+    for repo_name, repo in repos.items():
         if repo_name not in observed:
             continue
-        if "commit" not in repos[repo_name]:
+        if not isinstance(repo, dict) or "commit" not in repo:
             continue
         dependencies[repo_name] = Dependency(
             name=repo_name,
-            version=repos[repo_name]["commit"],
-            repository=repos[repo_name].get("url"),
+            version=repo["commit"],
+            repository=repo.get("url"),
         )
 
     return dependencies
@@ -1,7 +1,8 @@
+import json
 from abc import ABC
 from typing import Iterable, Optional, TextIO
 
-from .core import Upgrade
+from .core import Result, Upgrade
 from .jira import Ticket
 
 
@@ -12,6 +13,10 @@ def get_formatter(name: str, stream: TextIO):
         return DetailFormatter(stream)
     if name in ("markdown", "md"):
         return MarkdownFormatter(stream)
+    if name == "json":
+        return JsonFormatter(stream)
+    if name in ("ndjson", "jsonl"):
+        return NdjsonFormatter(stream)
     raise ValueError(f"Unknown format {name}")
 
 
@@ -24,6 +29,13 @@ class Formatter(ABC):
     def print(self, upgrade: Upgrade, tickets: Iterable[Ticket]) -> None:
         """Write textual representation of the upgrade and tickets to the internal stream."""
 
+    def header(self, title: str) -> None:
+        """Start a section of upgrades (e.g. of one commit or tag) called `title`."""
+        self._stream.write(f"\n{title}\n")
+
+    def close(self) -> None:
+        """Finish the output after all upgrades were printed."""
+
 
 class CommitFormatter(Formatter):
     needs_details = False
@@ -71,6 +83,9 @@ class DetailFormatter(Formatter):
 class MarkdownFormatter(Formatter):
     needs_details = True
 
+    def header(self, title: str) -> None:
+        self._stream.write(f"\n## {title}\n")
+
     def print(self, upgrade: Upgrade, tickets: Iterable[Ticket]):
         self._stream.write("\n")
         self._stream.write(f"### Dependency change {upgrade}")
@@ -83,3 +98,46 @@ class MarkdownFormatter(Formatter):
                 self._stream.write(f"- {ticket.name}: {ticket.url}\n")
             else:
                 self._stream.write(f"- [{ticket.name}]({ticket.url}): {ticket.summary}\n")
+
+
+class JsonFormatter(Formatter):
+    """All results as one JSON list - written when closed"""
+
+    needs_details = True
+
+    def __init__(self, stream: TextIO):
+        super().__init__(stream)
+        self._records: list[dict] = []
+        self._section: Optional[str] = None
+
+    def header(self, title: str) -> None:
+        self._section = title
+
+    def print(self, upgrade: Upgrade, tickets: Iterable[Ticket]):
+        self._records.append(_record(upgrade, tickets, self._section))
+
+    def close(self) -> None:
+        json.dump(self._records, self._stream, indent=2)
+        self._stream.write("\n")
+
+
+class NdjsonFormatter(Formatter):
+    """One JSON object per line and result - written (and flushed) as soon as it is known"""
+
+    needs_details = True
+    _section: Optional[str] = None
+
+    def header(self, title: str) -> None:
+        self._section = title
+
+    def print(self, upgrade: Upgrade, tickets: Iterable[Ticket]):
+        self._stream.write(json.dumps(_record(upgrade, tickets, self._section)) + "\n")
+        self._stream.flush()
+
+
+def _record(upgrade: Upgrade, tickets: Iterable[Ticket], section: Optional[str]) -> dict:
+    """Result as plain data - with the section (commit or tag) it belongs to if there is one"""
+    record = Result(upgrade, list(tickets)).as_dict()
+    if section is not None:
+        record["section"] = section
+    return record
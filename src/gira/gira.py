@@ -1,13 +1,20 @@
+import re
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, TextIO
+from typing import TYPE_CHECKING, Any, Callable, Generator, Iterator, Optional, TextIO
 
-from packaging.version import Version
+from . import cache, config, core, deps, formatter, index, jira, logger, repo, timing
 
-from . import cache, config, core, deps, formatter, jira, logger, repo
+# asyncio is imported only when there are upgrades to process - most hook runs have none
+if TYPE_CHECKING:
+    import asyncio
 
 
 def compare_versions(version_a: str, version_b: str) -> tuple[str, str]:
     """Return (lower, higher) versions from given version_a and version_b"""
+    from packaging.version import Version
+
     try:
         va = Version(version_a)
         vb = Version(version_b)
@@ -25,31 +32,229 @@ def gira(
     format: str,
     ref: Optional[str],
     include_changes_with_no_tickets: bool = False,
+    offline: bool = False,
+    revisions: Optional[str] = None,
+    per_tag: bool = False,
 ):
-    """Main function of gira"""
+    """Main function of gira - write results in the given format to the stream
+
+    With `revisions` (A..B) changes of every commit (or `per_tag`) of the range are written
+    under a header each, see releases. Reported tickets are recorded in the ticket index.
+    """
     fmt = formatter.get_formatter(format, stream)
+    shipped: list[tuple[str, core.Result]] = []
+    if revisions:
+        title = None
+        for section, result in releases(
+            config,
+            revisions,
+            per_tag,
+            include_changes_with_no_tickets,
+            offline,
+            details=fmt.needs_details,
+        ):
+            if section != title:
+                fmt.header(section)
+                title = section
+            fmt.print(result.upgrade, result.tickets)
+            shipped.append((section, result))
+    else:
+        for result in results(
+            config, ref, include_changes_with_no_tickets, offline, details=fmt.needs_details
+        ):
+            fmt.print(result.upgrade, result.tickets)
+            shipped.append(("", result))
+    fmt.close()
+    # remember where the tickets were shipped for `gira find`
+    if shipped:
+        index.record(cache.CACHE_DIR / index.FILENAME, shipped, repo.identity(Path(".")))
+
+
+def _use_cache_dir(config: config.Config) -> None:
+    """Cache in the directory named by the configuration, else keep cache.CACHE_DIR as it is"""
+    if config.cache.get("dir"):
+        cache.CACHE_DIR = cache.cache_dir(config.cache["dir"])
+
+
+def results(
+    config: config.Config,
+    ref: Optional[str] = None,
+    include_changes_with_no_tickets: bool = False,
+    offline: bool = False,
+    details: bool = False,
+) -> Iterator[core.Result]:
+    """Yield a Result for every reported dependency change of the current repository
+
+    Changes are diffed from `ref` (see gira) and yielded in a stable order, each one as soon as
+    it and the ones before it are done - the others are processed concurrently meanwhile.
+    With `details` tickets carry summaries and URLs from JIRA.
+    """
+    _use_cache_dir(config)
 
     # Diff current repository using firstly the revision if specified, then staged changes,
     # unstaged changes and finally try diff with last commit. We use diffs with 3 context lines that
     # are necessary for example for poetry.lock that has records spread over multiple lines
-    repository = repo.Repo(Path("."), ref=ref)
-    files: list[Path] = repository.changed_files()
+    # Only files that some dependency parser accepts (and .bb recipes) are diffed at all
+    with timing.span("diff"):
+        repository = repo.Repo(Path("."), ref=ref, pathspecs=[*deps.FILENAME_GLOBS, "*.bb"])
+        files: list[Path] = repository.changed_files()
     logger.debug(f"Changed files from {repository.ref}: {files}")
 
-    # Which JIRA keys to look for. With jira.prefix set (e.g. "DH" or ["DH", "OCD"])
-    # only those prefixes are matched; otherwise any uppercase prefix is auto-detected.
-    ticket_pattern = jira.ticket_pattern(config.jira.get("prefix"))
+    upgrades = _upgrades(
+        config.observe,
+        files,
+        repository.get_old_content,
+        repository.get_current_content,
+        deps.KasDocuments(repository.get_old_content),
+        deps.KasDocuments(repository.get_current_content),
+    )
+
+    # Submodules - we cannot cache them because they are already "cached" in
+    # .git/modules directory. Hence we just get the messages from the submodule repository
+    modules: dict[str, Path] = {}
+    if config.submodules and repository.has_submodules:
+        for file in files:
+            if file in repository.submodules:
+                old_version, new_version = repository.submodule_change(file)
+                upgrades.append(_submodule(repository, file, old_version, new_version, modules))
+
+    yield from _process(
+        upgrades,
+        modules,
+        config,
+        include_changes_with_no_tickets,
+        offline,
+        details,
+    )
+
+
+def releases(
+    config: config.Config,
+    revisions: str,
+    per_tag: bool = False,
+    include_changes_with_no_tickets: bool = False,
+    offline: bool = False,
+    details: bool = False,
+) -> Iterator[tuple[str, core.Result]]:
+    """Yield (section, Result) for dependency changes of every commit in a range A..B
 
+    Walks the history of the current repository instead of diffing its working tree. Sections
+    are the commits (a short hash and the subject) or, `per_tag`, the tags of the range - all
+    changes of a dependency up to a tag are merged into one. Commits after the last tag make
+    a section called B. Repositories are fetched and walked once for the whole range.
+    """
+    _use_cache_dir(config)
+    a, separator, b = revisions.partition("..")
+    if not separator or not a:
+        raise ValueError(f"Range {revisions} is not in the form A..B")
+    b = b or "HEAD"
+
+    with timing.span("history", range=revisions):
+        repository = repo.Repo(Path("."), ref="HEAD", pathspecs=[*deps.FILENAME_GLOBS, "*.bb"])
+        commits = repository.history(a, b)
+    logger.debug(f"Commits changing dependency files in {a}..{b}: {len(commits)}")
+
+    changed: dict[str, list[core.Upgrade]] = {}  # commit -> its changes
+    modules: dict[str, Path] = {}
+    for commit, changes in commits:
+        files = [Path(p) for p in changes]
+        parent = f"{commit}^"
+        # the content is read right away, while the commit is still the current one
+        upgrades = _upgrades(
+            config.observe,
+            files,
+            lambda path: repository.get_blob_content(changes[path.as_posix()][0]),
+            lambda path: repository.get_blob_content(changes[path.as_posix()][1]),
+            deps.KasDocuments(lambda path: repository.get_content(parent, path)),
+            deps.KasDocuments(lambda path: repository.get_content(commit, path)),
+            by_content=True,  # the working tree may not have the file, or another version of it
+        )
+        if config.submodules:
+            for file in files:
+                if file in repository.submodules:
+                    old_version, new_version = changes[file.as_posix()]
+                    upgrades.append(_submodule(repository, file, old_version, new_version, modules))
+        if upgrades:
+            changed[commit] = upgrades
+
+    sections: dict[str, list[core.Upgrade]]
+    if per_tag:
+        sections = _per_tag(repository.tags(), repository.mainline(a, b), changed, b)
+    else:
+        sections = {}
+        for commit, upgrades in changed.items():
+            subject = repository.resolve(commit).message.split("\n", 1)[0]
+            sections[f"{commit[:7]} {subject}"] = upgrades
+
+    # all sections go through the pipeline at once so that nothing is fetched or walked twice
+    order = [(title, u) for title, upgrades in sections.items() for u in upgrades]
+    section = {id(u): title for title, u in order}
+    for result in _process(
+        [u for _, u in order],
+        modules,
+        config,
+        include_changes_with_no_tickets,
+        offline,
+        details,
+    ):
+        yield section[id(result.upgrade)], result
+
+
+def _per_tag(
+    tags: dict[str, str],
+    mainline: list[str],
+    changed: dict[str, list[core.Upgrade]],
+    untagged: str,
+) -> dict[str, list[core.Upgrade]]:
+    """Group changes of commits by the first tag (of the mainline commits) containing them
+
+    Changes of one dependency within a tag are merged into one from the first old to the last
+    new version (and dropped if the dependency ends where it started). Changes after the last
+    tag are grouped under `untagged`.
+    """
+    sections: dict[str, list[core.Upgrade]] = {}
+    pending: dict[str, core.Upgrade] = {}
+    for commit in mainline + [""]:  # the empty one collects the untagged rest
+        for upgrade in changed.get(commit, []):
+            if upgrade.name in pending:
+                pending[upgrade.name].new_version = upgrade.new_version
+                pending[upgrade.name].new_oid = upgrade.new_oid
+            else:
+                pending[upgrade.name] = upgrade
+        if commit in tags or not commit:
+            merged = [u for u in pending.values() if u.old_version != u.new_version]
+            if merged:
+                sections[tags.get(commit, untagged)] = merged
+            pending = {}
+    return sections
+
+
+def _upgrades(
+    observe: dict[str, str],
+    files: list[Path],
+    old_content: Callable[[Path], str],
+    new_content: Callable[[Path], str],
+    old_documents: deps.KasDocuments,
+    new_documents: deps.KasDocuments,
+    by_content: bool = False,
+) -> list[core.Upgrade]:
+    """Return changes of observed dependencies between the old and new content of files
+
+    Besides dependency files, renamed .bb recipes with versions in their names are changes too.
+    KAS files are recognized in the working tree or, `by_content`, by their new (or old) content.
+    """
     # extract changes from diffs of locks or other dependency specifying files
     upgrades: list[core.Upgrade] = []
     for file in files:
-        if not deps.is_parsable(file):
+        content = (new_content(file) or old_content(file)) if by_content else None
+        if not deps.is_parsable(file, content):
             if file.suffix != ".bb":
                 logger.debug(f"Skipping {file} - no dependency parser for it")
             continue
         logger.debug(f"Processing {file} for dependencies")
-        pre = deps.parse(file, repository.get_old_content(file), config.observe)
-        post = deps.parse(file, repository.get_current_content(file), config.observe)
+        with timing.span("parse", file=str(file)):
+            pre = deps.parse(file, old_content(file), observe, old_documents)
+            post = deps.parse(file, new_content(file), observe, new_documents)
         logger.debug(f"  observed dependencies in {file} before: {pre}")
         logger.debug(f"  observed dependencies in {file} after:  {post}")
         for dep in pre:
@@ -73,7 +278,7 @@ def gira(
     for file in files:
         if file.suffix == ".bb" and "_" in file.name:
             package_name, package_version = file.stem.split("_", 1)
-            if package_name not in config.observe:
+            if package_name not in observe:
                 continue
             if package_name not in renames:
                 renames[package_name] = package_version
@@ -94,62 +299,224 @@ def gira(
                 )
             )
 
-    # Submodules - we cannot cache them because they are already "cached" in
-    # .git/modules directory. Hence we just get the messages from the submodule repository
-    if config.submodules and repository.has_submodules:
-        for file in files:
-            if file in repository.submodules:
-                name = repository.submodules[file]
-                module_path = Path(".git/modules/", name)
-                old_version, new_version = repository.submodule_change(file)
-                upgrades.append(
-                    core.Upgrade(
-                        name=name,
-                        old_version=old_version,
-                        new_version=new_version,
-                        messages=repo.Repo(module_path, bare=True, ref="HEAD").messages(
-                            old_version
-                        ),
-                    )
-                )
+    return upgrades
+
+
+def _submodule(
+    repository: repo.Repo, file: Path, old_version: str, new_version: str, modules: dict[str, Path]
+) -> core.Upgrade:
+    """Return change of a submodule and record where its repository is in `modules`"""
+    name = repository.submodules[file]
+    modules[name] = Path(".git/modules/", name)
+    return core.Upgrade(
+        name=name,
+        old_version=old_version,
+        new_version=new_version,
+        old_oid=old_version or None,
+        new_oid=new_version or None,
+    )
 
-    # extract JIRA tickets from commit messages between two tags that follow semantic release
-    # modify upgrades by creating dict with keys but empty values (ready for summaries of tickets)
+
+def _process(
+    upgrades: list[core.Upgrade],
+    modules: dict[str, Path],
+    config: config.Config,
+    include_changes_with_no_tickets: bool,
+    offline: bool,
+    details: bool,
+) -> Iterator[core.Result]:
+    """Yield results of upgrades in their order while processing them all concurrently"""
+    # Which JIRA keys to look for. With jira.prefix set (e.g. "DH" or ["DH", "OCD"])
+    # only those prefixes are matched; otherwise any uppercase prefix is auto-detected.
+    ticket_pattern = jira.ticket_pattern(config.jira.get("prefix"))
+
+    if not upgrades:
+        return
+    import asyncio
+
+    # tickets extracted by previous runs between the same immutable versions need no repository
+    related = config.cache.get("related")
     for upgrade in upgrades:
-        if upgrade.messages is None:
-            if upgrade.repository is not None:
-                upgrade.messages = (
-                    repo.Repo(module_path).messages(
-                        upgrade.old_version,
-                        upgrade.new_version,
-                    ),
+        url = config.observe.get(upgrade.name) or upgrade.repository
+        if upgrade.name not in modules and url and upgrade.old_version and upgrade.new_version:
+            upgrade.tickets = cache.stored_tickets(
+                url,
+                upgrade.old_version,
+                upgrade.new_version,
+                ticket_pattern,
+                history=config.history,
+                related=related,
+            )
+            if upgrade.tickets is not None:
+                upgrade.old_oid, upgrade.new_oid = cache.stored_oids(
+                    url, upgrade.old_version, upgrade.new_version, related
                 )
-            elif upgrade.name in config.observe:
-                url = config.observe[
-                    upgrade.name
-                ]  # this might return an object with more information
-                try:
-                    upgrade.messages = cache.cache(upgrade.name, url).messages(
-                        upgrade.old_version, upgrade.new_version
-                    )
-                except KeyError as e:
-                    logger.error(
-                        f"Repository {upgrade.name} does not contain {e.args[0]} "
-                        "Might have been deleted locally or remotely. Skipping"
-                    )
-                    continue
-            else:
-                logger.warning("Cannot get repository URL of {upgrade.name} from anywhere")
 
-        logger.debug(
-            f"Messages for {upgrade.name} between {upgrade.new_version} and"
-            f" {upgrade.old_version}: {upgrade.messages}"
+    run = _run(
+        upgrades, modules, config, ticket_pattern, include_changes_with_no_tickets, offline, details
+    )
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        yield from run
+    else:
+        # asyncio.Runner refuses to run in the thread of a running loop (results called from
+        # async code) - it gets a thread of its own then
+        yield from _in_thread(run)
+
+
+def _run(
+    upgrades: list[core.Upgrade],
+    modules: dict[str, Path],
+    config: config.Config,
+    ticket_pattern: re.Pattern,
+    include_changes_with_no_tickets: bool,
+    offline: bool,
+    details: bool,
+) -> Generator[core.Result, None, None]:
+    """Yield results of upgrades in their order from an event loop of their own (see _start)"""
+    import asyncio
+
+    # leaving the runner (also when the consumer stops early) cancels whatever still runs
+    with asyncio.Runner() as runner:
+        pending = runner.run(
+            _start(
+                upgrades,
+                modules,
+                config,
+                ticket_pattern,
+                include_changes_with_no_tickets,
+                offline,
+                details,
+            )
         )
-        tickets = {
-            ticket
-            for m in upgrade.messages
-            for ticket in jira.extract_ticket_names(m, ticket_pattern)
-        }
+        for task in pending:
+            result = runner.get_loop().run_until_complete(task)
+            if result is not None:
+                yield result
+
+
+def _in_thread(results: Generator[core.Result, None, None]) -> Iterator[core.Result]:
+    """Yield from the results advanced (and closed) by a worker thread - always the same one"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        try:
+            while (result := executor.submit(next, results, None).result()) is not None:
+                yield result
+        finally:
+            executor.submit(results.close).result()
+
+
+async def _start(
+    upgrades: list[core.Upgrade],
+    modules: dict[str, Path],
+    config: config.Config,
+    ticket_pattern: re.Pattern,
+    include_changes_with_no_tickets: bool,
+    offline: bool,
+    details: bool,
+) -> list["asyncio.Task"]:
+    """Start finding tickets of all upgrades, return tasks resulting in Result (or None to skip)
+
+    Every upgrade goes through fetching its repository, walking its history, extracting tickets
+    and looking up their details on its own, so that the fetch of one overlaps the history walk
+    of another and the Jira lookup of a third. Blocking work runs in threads.
+    """
+    import asyncio
+
+    # clone/fetch repositories of all upgrades that still miss their tickets in the background
+    fetches = cache.submit_all(
+        (u for u in upgrades if u.name not in modules and u.tickets is None),
+        config.observe,
+        offline=offline,
+        **config.cache,
+    )
+    # names may share a repository - their walks take turns here instead of blocking threads
+    repository_locks: dict[Path, asyncio.Lock] = {}
+    # tickets of upgrades walked in the same loop iteration are looked up in one batch, batches
+    # run concurrently - each ticket is looked up once, its future is shared by all upgrades
+    lookups: dict[str, asyncio.Future] = {}
+    batch: list[str] = []
+    flushes: set[asyncio.Task] = set()
+    jira_client: Optional[jira.Jira] = None
+
+    async def flush() -> None:
+        nonlocal jira_client
+        names = batch[:]
+        batch.clear()
+        try:
+            if jira_client is None:
+                jira_client = jira.shared(
+                    **config.jira, cache_path=cache.CACHE_DIR / "jira.json", offline=offline
+                )
+            found = await asyncio.to_thread(jira_client.get_tickets_details, names)
+        except Exception as e:
+            for name in names:
+                lookups[name].set_exception(e)
+            return
+        for name in names:
+            lookups[name].set_result(found.get(name))
+
+    def schedule_flush() -> None:
+        task = asyncio.create_task(flush())
+        flushes.add(task)
+        task.add_done_callback(flushes.discard)
+
+    async def look_up(tickets: list[str]) -> list[jira.Ticket]:
+        loop = asyncio.get_running_loop()
+        for name in tickets:
+            if name not in lookups:
+                if not batch:
+                    loop.call_soon(schedule_flush)
+                lookups[name] = loop.create_future()
+                batch.append(name)
+        found = [await lookups[name] for name in tickets]
+        return [ticket for ticket in found if ticket is not None]
+
+    def locked_walk(upgrade: core.Upgrade, repository: repo.Repo, url: Optional[str]) -> None:
+        # a cached repository is shared with the fetches of other names (see cache._open)
+        with repository.lock:
+            _walk(
+                upgrade,
+                repository,
+                ticket_pattern,
+                config.history,
+                url,
+                config.cache.get("related"),
+            )
+
+    async def walk(upgrade: core.Upgrade) -> bool:
+        """Set tickets of the upgrade from its history, return False if it has to be skipped"""
+        url: Optional[str] = None  # of cached repositories, whose tickets are stored
+        if upgrade.name in modules:
+            repository = repo.Repo(modules[upgrade.name], bare=True, ref="HEAD")
+        elif upgrade.tickets is not None:
+            return True
+        elif upgrade.name not in fetches:
+            return False  # missing URL was already reported by cache.submit_all
+        else:
+            try:
+                with _stage(upgrade, "cache"):
+                    repository = await asyncio.wrap_future(fetches[upgrade.name])
+            except Exception:
+                return False  # the failure was already reported by cache.submit_all
+            url = config.observe.get(upgrade.name) or upgrade.repository
+        async with repository_locks.setdefault(repository.path, asyncio.Lock()):
+            try:
+                await asyncio.to_thread(locked_walk, upgrade, repository, url)
+            except KeyError as e:
+                logger.error(
+                    f"Repository {upgrade.name} does not contain {e.args[0]} "
+                    "Might have been deleted locally or remotely. Skipping"
+                )
+                return False
+        return True
+
+    async def result(upgrade: core.Upgrade) -> Optional[core.Result]:
+        if not await walk(upgrade):
+            return None
+        tickets = upgrade.tickets or []
         logger.debug(f"Extracted tickets: {tickets}")
         if len(tickets) == 0:
             logger.info(
@@ -157,10 +524,87 @@ def gira(
                 f" {upgrade.new_version} and {upgrade.old_version}"
             )
             if not include_changes_with_no_tickets:
-                continue
+                return None
+        if not details:
+            return core.Result(upgrade, list(map(jira.Ticket, tickets)))
+        with _stage(upgrade, "jira"):
+            return core.Result(upgrade, await look_up(tickets))
 
-        if fmt.needs_details:
-            jira_client = jira.Jira(**config.jira)
-            fmt.print(upgrade, map(jira_client.get_ticket_details, sorted(tickets)))
-        else:
-            fmt.print(upgrade, map(jira.Ticket, sorted(tickets)))
+    return [asyncio.create_task(result(upgrade)) for upgrade in upgrades]
+
+
+def _walk(
+    upgrade: core.Upgrade,
+    repository: repo.Repo,
+    ticket_pattern: re.Pattern,
+    history: dict[str, Any],
+    url: Optional[str] = None,
+    related: Optional[dict[str, str]] = None,
+) -> None:
+    """Set commits and tickets of the upgrade from the history of the repository
+
+    Tickets of a repository cached from `url` are looked up in and stored to the ticket store
+    (see cache.stored_tickets).
+
+    @throws KeyError if the repository does not contain any of the versions
+    """
+    old_version, new_version = upgrade.old_version or "", upgrade.new_version or ""
+    # only submodules may lack the new version - their histories are not cached
+    if not (old_version and new_version):
+        url = None
+    if url:
+        upgrade.old_oid, upgrade.new_oid = (
+            str(c.id) for c in repository.resolve_range(old_version, new_version)
+        )
+        upgrade.tickets = cache.stored_tickets(
+            url,
+            old_version,
+            new_version,
+            ticket_pattern,
+            repository,
+            history=history,
+            related=related,
+        )
+        if upgrade.tickets is not None:
+            return
+    with _stage(upgrade, "messages"):
+        commits = repository.commits(
+            old_version,
+            new_version or None,  # submodules without one up to their checkout
+            limit=history.get("limit", repo.Repo.MESSAGE_LIMIT),
+            first_parent=bool(history.get("first_parent", False)),
+        )
+        upgrade.messages = [commit.message.strip() for commit in commits]
+    logger.debug(
+        f"Messages for {upgrade.name} between {upgrade.new_version} and"
+        f" {upgrade.old_version}: {upgrade.messages}"
+    )
+    ticket_commits: dict[str, list[Any]] = {}
+    for commit, message in zip(commits, upgrade.messages):
+        for ticket in jira.extract_ticket_names(message, ticket_pattern):
+            ticket_commits.setdefault(ticket, []).append(commit.id)
+    upgrade.tickets = sorted(ticket_commits)
+    if url:
+        # versions between the old and new one may have shipped the tickets first (see index)
+        upgrade.first_tags = repository.first_tags(ticket_commits, {c.id for c in commits})
+        cache.store_tickets(
+            url,
+            repository,
+            old_version,
+            new_version,
+            ticket_pattern,
+            upgrade.tickets,
+            history=history,
+            related=related,
+        )
+
+
+@contextmanager
+def _stage(upgrade: core.Upgrade, name: str) -> Iterator[None]:
+    """Record the duration of the block in the timings of the upgrade (and as a timing span)"""
+    start = time.perf_counter()
+    try:
+        with timing.span(name, dependency=upgrade.name):
+            yield
+    finally:
+        upgrade.timings[name] = upgrade.timings.get(name, 0.0) + time.perf_counter() - start
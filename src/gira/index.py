@@ -0,0 +1,114 @@
+"""index remembers which dependency versions and host releases shipped which tickets
+
+Every run records the tickets it reported: the host repository, the dependency, the version that
+brought them in and, when walking the host history (--range), the host commit or tag. The index
+is a SQLite database in the cache directory shared by all projects, so looking a ticket up does
+not depend on the size of the history.
+"""
+
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from . import core, logger
+
+FILENAME = "tickets.sqlite"
+
+
+@dataclass(frozen=True)
+class Shipment:
+    ticket: str
+    dependency: str
+    version: str  # version of the dependency that brought the ticket in
+    oid: Optional[str]  # commit of that version (if known)
+    host: str  # host commit or tag it was recorded for, empty outside of history runs
+    repository: str  # host repository (see repo.identity)
+
+
+def record(path: Path, results: Iterable[tuple[str, core.Result]], repository: str) -> None:
+    """Add tickets of (host, Result) pairs of the host `repository` to the index at `path`
+
+    Known tickets are kept as they are. A ticket is recorded with the first tagged version between
+    the old and new version that contains it (Upgrade.first_tags) if known, else with the new
+    version. Both are only upper bounds: tags that were not fetched (see cache) cannot be told
+    apart, so find reports the lowest version recorded. A failure to write the index is only
+    logged as it must not fail a run.
+    """
+    rows = [
+        (
+            ticket.name,
+            r.upgrade.name,
+            *r.upgrade.first_tags.get(ticket.name, (r.upgrade.new_version, r.upgrade.new_oid)),
+            host,
+            repository,
+        )
+        for host, r in results
+        if r.upgrade.new_version
+        for ticket in r.tickets
+    ]
+    if not rows:
+        return
+    try:
+        connection = _connect(path)
+        try:
+            with connection:  # one transaction
+                connection.executemany(
+                    "INSERT OR IGNORE INTO shipments VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Ticket index {path} cannot be updated: {e}")
+
+
+def find(path: Path, ticket: str, repository: Optional[str] = None) -> list[Shipment]:
+    """Return where the ticket was shipped - per dependency the first version first
+
+    With `repository` only what that host repository shipped is returned. Versions are ordered
+    as versions where possible, otherwise in the order they were recorded.
+    """
+    if not path.exists():
+        return []
+    connection = _connect(path)
+    try:
+        query = "SELECT rowid, * FROM shipments WHERE ticket = ?"
+        parameters = (ticket,) if repository is None else (ticket, repository)
+        if repository is not None:
+            query += " AND repository = ?"
+        rows = connection.execute(query + " ORDER BY rowid", parameters).fetchall()
+    finally:
+        connection.close()
+    shipments = {rowid: Shipment(*row) for rowid, *row in rows}
+    order = {s.dependency: rowid for rowid, s in reversed(shipments.items())}
+    return [
+        shipments[rowid]
+        for rowid in sorted(
+            shipments,
+            key=lambda r: (order[shipments[r].dependency], _version_key(shipments[r].version, r)),
+        )
+    ]
+
+
+def _version_key(version: str, rowid: int) -> tuple[int, Any]:
+    from packaging.version import InvalidVersion, Version
+
+    try:
+        return (0, Version(version))
+    except InvalidVersion:
+        return (1, rowid)
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10)
+    with connection:
+        # records of the first schema lack the host repository and cannot be told apart
+        connection.execute("DROP TABLE IF EXISTS shipped")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS shipments ("
+            " ticket TEXT NOT NULL, dependency TEXT NOT NULL, version TEXT NOT NULL, oid TEXT,"
+            " host TEXT NOT NULL, repository TEXT NOT NULL,"
+            " PRIMARY KEY (ticket, dependency, version, host, repository))"
+        )
+    return connection
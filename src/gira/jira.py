@@ -1,16 +1,21 @@
+import json
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Optional, Union
+from typing import TYPE_CHECKING, Any, Iterable, Optional, Union
 
-from jira import JIRA as JIRAClient
-from jira import JIRAError
-
-from . import logger
+from . import logger, timing
 from .config import ConfigError
 
-_ = JIRAError
+# python-jira (and requests with it) is imported only when Jira is really asked - most runs
+# print just ticket names and it would be the slowest part of their startup
+if TYPE_CHECKING:
+    from jira import JIRA as JIRAClient
+
 # By default any uppercase prefix is auto-detected (e.g. PROJ-123). A configured
 # prefix narrows this down and disables the auto-detection (see ticket_pattern).
 DEFAULT_TICKET_RE = re.compile(r"(?P<ticket>[A-Z]+-\d+)")
@@ -82,15 +87,92 @@ def _from_env(field: str) -> str:
     return os.environ.get(f"JIRA_{field}") or os.environ.get(f"GIRA_JIRA_{field}") or ""
 
 
+class TicketCache:
+    """On-disk cache of ticket summaries shared by all runs
+
+    Every entry remembers when it was fetched (to expire it after `ttl` seconds) and when it was
+    last used (to evict the least recently used entries above `size`). Tickets that Jira does
+    not know are cached too (with summary None) so they are not searched for again and again.
+    Jira keys entries by ticket URL, so tickets of different servers do not mix.
+    It may be used from several threads at once.
+    """
+
+    def __init__(self, path: Optional[Path], ttl: float, size: int):
+        self.path = path
+        self.ttl = ttl
+        self.size = size
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path is not None and path.exists():
+            try:
+                self._entries = json.loads(path.read_text())
+            except ValueError:
+                logger.warning(f"Ignoring corrupted Jira ticket cache {path}")
+
+    def get(self, name: str, stale: bool = False) -> Optional[dict[str, Any]]:
+        """Return the cached entry {url, summary, fetched} of a ticket if it did not expire"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or (not stale and time.time() - entry["fetched"] > self.ttl):
+                return None
+            entry["used"] = time.time()
+            self._dirty = True
+            return dict(entry)
+
+    def put(self, name: str, url: str, summary: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._entries[name] = {"url": url, "summary": summary, "fetched": now, "used": now}
+            self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return
+            if len(self._entries) > self.size:
+                recent = sorted(self._entries.items(), key=lambda e: e[1]["used"], reverse=True)
+                self._entries = dict(recent[: self.size])
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._entries))
+            tmp.replace(self.path)
+            self._dirty = False
+
+
 class Jira:
+    """Jira connection and ticket cache - get_tickets_details may be called from several threads
+
+    All calls share `jobs` concurrent searches (and kept-alive connections).
+    """
+
+    # keys asked for in one `key in (...)` JQL search; Jira Cloud caps a page at 100 results
+    MAX_SEARCH_KEYS = 50
+    MAX_RETRIES = 3  # of a request refused for overload (429, 503) or a broken connection
+
     url: str
     token: Optional[str]
     email: Optional[str]
     projects: list[str]
 
-    _client: Optional[JIRAClient]
+    _client: Optional["JIRAClient"]
+
+    DEFAULT_TTL = 7 * 24 * 3600.0  # seconds a cached ticket summary is trusted
+    DEFAULT_CACHE_SIZE = 10000  # tickets kept in the on-disk cache
+    DEFAULT_JOBS = 4  # concurrent searches (and kept-alive connections) to Jira
 
-    def __init__(self, url: str = "", token: str = "", email: str = "", **_: Any):
+    def __init__(
+        self,
+        url: str = "",
+        token: str = "",
+        email: str = "",
+        ttl: float = DEFAULT_TTL,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        cache_path: Optional[Path] = None,
+        offline: bool = False,
+        jobs: int = DEFAULT_JOBS,
+        **_: Any,
+    ):
         # Config values win; otherwise fall back to JIRA_<FIELD>/GIRA_JIRA_<FIELD>.
         # Each value may also use the env:VARNAME or file:path syntax (see _get_value).
         self.url = _get_value(url) or _from_env("URL")
@@ -99,19 +181,36 @@ class Jira:
         self.projects = []
         self._client = None
         self._connect_error = 0
+        self.offline = offline
+        self.jobs = max(1, int(jobs))
+        self._searches = threading.BoundedSemaphore(self.jobs)
+        self._connect_lock = threading.Lock()
+        self._cache = TicketCache(cache_path, float(ttl), int(cache_size))
         if self.token and not self.url:
             raise ConfigError("jira.token provided without jira.url")
 
     def connect(self):
+        from jira import JIRA as JIRAClient
+        from requests.adapters import HTTPAdapter
+
+        # connecting asks the server at once: an unreachable one fails now instead of after
+        # minutes of retries, the requests of a connected client are retried again
         if self.url and self.email and self.token:
             logger.debug(f"Jira connecting to {self.url} with email {self.email} and a token")
-            self._client = JIRAClient(self.url, basic_auth=(self.email, self.token))
+            client = JIRAClient(self.url, basic_auth=(self.email, self.token), max_retries=0)
         elif self.url and self.token:
             logger.debug(f"Jira connecting to {self.url} with token")
-            self._client = JIRAClient(self.url, token_auth=self.token)
+            client = JIRAClient(self.url, token_auth=self.token, max_retries=0)
         else:
             logger.debug("No Jira connection details provided")
             self._client = None
+            return
+        client._session.max_retries = self.MAX_RETRIES
+        self._client = client
+        # one kept-alive connection per concurrent search instead of a handshake per request
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.jobs)
+        self._client._session.mount("https://", adapter)
+        self._client._session.mount("http://", adapter)
 
     def __str__(self):
         return f"Jira(url={self.url}, token={self.token})"
@@ -119,18 +218,81 @@ class Jira:
     def get_ticket_details(self, name: str) -> Optional[Ticket]:
         return self.update_ticket_details(Ticket(name))
 
+    def get_tickets_details(self, names: Iterable[str]) -> dict[str, Ticket]:
+        """Return {name: Ticket} for all given names using as few JQL searches as possible
+
+        Summaries are served from the ticket cache while they are fresh. Tickets that Jira does
+        not know are reported at once and left out. Without a Jira connection, offline, or when
+        Jira fails to answer, the tickets missing in the cache are returned with just their URLs.
+        """
+        tickets = {name: self._ticket(name) for name in dict.fromkeys(names)}
+        if not tickets:
+            return tickets
+
+        found: set[str] = set()
+        unknown: set[str] = set()
+        for name, ticket in tickets.items():
+            entry = self._cache.get(self._cache_key(name), stale=self.offline)
+            if entry is None:
+                continue
+            if entry["summary"] is None:
+                unknown.add(name)
+            else:
+                ticket.summary = entry["summary"]
+                found.add(name)
+        names = [name for name in tickets if name not in found and name not in unknown]
+        logger.debug(f"Jira ticket cache hits: {len(found) + len(unknown)}, misses: {len(names)}")
+
+        if names and not self.offline:
+            self._connect_once()
+        if self._client is None:
+            self._cache.save()
+            return {name: ticket for name, ticket in tickets.items() if name not in unknown}
+
+        from jira import JIRAError
+        from requests import RequestException
+
+        chunks = [
+            names[i : i + self.MAX_SEARCH_KEYS] for i in range(0, len(names), self.MAX_SEARCH_KEYS)
+        ]
+        failed: list[str] = []
+        with ThreadPoolExecutor(max_workers=min(self.jobs, max(1, len(chunks)))) as executor:
+            futures = [executor.submit(self._search, chunk) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    result = future.result()
+                except (JIRAError, RequestException) as e:
+                    logger.debug(str(e))
+                    failed.extend(chunk)
+                    continue
+                for key, summary in result.items():
+                    if key in tickets:
+                        tickets[key].summary = summary
+                        found.add(key)
+        for name in names:
+            if name not in failed:  # looked up again by the next run
+                self._cache.put(
+                    self._cache_key(name),
+                    tickets[name].url,
+                    tickets[name].summary if name in found else None,
+                )
+        self._cache.save()
+
+        if failed:
+            logger.warning(f"Jira search failed, tickets without summaries: {', '.join(failed)}")
+        missing = [name for name in names if name not in found and name not in failed]
+        if missing:
+            logger.warning(f"Tickets not found in Jira: {', '.join(missing)}")
+        return {name: ticket for name, ticket in tickets.items() if name in found or name in failed}
+
     def update_ticket_details(self, ticket: Ticket) -> Optional[Ticket]:
+        from jira import JIRAError
+        from requests import RequestException
+
         if self.url:
-            ticket.url = (self.url + "/browse/" + ticket.name).replace("//browse", "/browse")
+            ticket.url = self._url(ticket.name)
 
-        if self._client is None and self._connect_error == 0:
-            try:
-                self.connect()
-            except JIRAError as e:
-                if e.status_code == 401:
-                    raise ConfigError("Invalid Jira credentials")
-                logger.warning(f"Jira connection error: {e.status_code} - {e.text[:50]}...")
-                self._connect_error += 1
+        self._connect_once()
 
         if self._client is not None:
             try:
@@ -139,5 +301,82 @@ class Jira:
                 logger.warning(f"{ticket.name}: {e.text} ({e.status_code})")
                 logger.debug(str(e))
                 return None
+            except RequestException as e:
+                logger.warning(f"{ticket.name}: Jira did not answer, ticket without summary")
+                logger.debug(str(e))
 
         return ticket
+
+    def _connect_once(self):
+        """Connect unless connected or failed already - a failure leaves the client unset"""
+        from jira import JIRAError
+        from requests import RequestException
+
+        with self._connect_lock:
+            if self._client is None and self._connect_error == 0:
+                try:
+                    with timing.span("jira.connect"):
+                        self.connect()
+                except JIRAError as e:
+                    if e.status_code == 401:
+                        raise ConfigError("Invalid Jira credentials")
+                    logger.warning(f"Jira connection error: {e.status_code} - {e.text[:50]}...")
+                    self._connect_error += 1
+                except RequestException as e:  # unreachable server, TLS errors, ...
+                    logger.warning(f"Jira connection error: {e}")
+                    self._connect_error += 1
+
+    def _search(self, names: list[str]) -> dict[str, str]:
+        """Return {key: summary} of the tickets found by one `key in (...)` search
+
+        Jira refuses the whole query (400) because of a single unknown key, so a refused search
+        is split in halves until the offending keys are isolated.
+
+        @throws JIRAError if the search fails otherwise (e.g. Jira is unavailable)
+        """
+        from jira import JIRAError
+
+        assert self._client is not None
+        jql = "key in ({})".format(", ".join(f'"{name}"' for name in names))
+        try:
+            with self._searches, timing.span("jira.search", keys=len(names)):
+                issues = self._client.search_issues(
+                    jql, fields="summary", maxResults=len(names), validate_query=False
+                )
+        except JIRAError as e:
+            if e.status_code != 400:
+                raise
+            if len(names) == 1:
+                logger.debug(f"{names[0]}: {e.text} ({e.status_code})")
+                return {}
+            half = len(names) // 2
+            return {**self._search(names[:half]), **self._search(names[half:])}
+        return {issue.key: issue.fields.summary for issue in issues}
+
+    def _ticket(self, name: str) -> Ticket:
+        return Ticket(name, url=self._url(name) if self.url else "")
+
+    def _url(self, name: str) -> str:
+        return (self.url + "/browse/" + name).replace("//browse", "/browse")
+
+    def _cache_key(self, name: str) -> str:
+        """Key of a ticket in the ticket cache - the same key may exist on several servers"""
+        return self._url(name) if self.url else name
+
+
+_shared: dict[str, Jira] = {}
+
+
+def shared(**options: Any) -> Jira:
+    """Return a Jira client for `options` (see Jira) kept for the life of the process
+
+    A long running process (daemon) so keeps its connections and ticket cache warm. The Jira
+    environment variables are a part of the key as the client may take its settings from them.
+    """
+    env = {k: v for k, v in os.environ.items() if k.startswith(("JIRA_", "GIRA_JIRA_"))}
+    key = json.dumps([options, env], sort_keys=True, default=str)
+    if key not in _shared:
+        _shared[key] = Jira(**options)
+    client = _shared[key]
+    client._connect_error = 0  # a connection that failed in a previous run is tried again
+    return client
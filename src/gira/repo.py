@@ -1,10 +1,13 @@
+import fnmatch
 import re
-from pathlib import Path
-from typing import Optional
+import subprocess
+import threading
+from pathlib import Path, PurePosixPath
+from typing import Any, Optional
 
 import pygit2  # type: ignore
 
-from . import AlrightException, logger
+from . import AlrightException, logger, timing
 
 
 def _v2t(v: str) -> str:
@@ -15,6 +18,80 @@ def _v2t(v: str) -> str:
     return v
 
 
+_NULL_OID = "0" * 40
+
+
+def normalize_version(version: str) -> Optional[str]:
+    """Return the normalized form of a version (1.13rc1 for v1.13.0-rc.1) or None if it is not one
+
+    Versions equal as PEP 440 versions normalize to the same string - trailing zeros of the
+    release are dropped, so 1.2 and v1.2.0 are both 1.2.
+    """
+    from packaging.utils import canonicalize_version
+    from packaging.version import InvalidVersion, Version
+
+    try:
+        return canonicalize_version(Version(version))
+    except InvalidVersion:
+        try:
+            return canonicalize_version(Version(_v2t(version)))
+        except InvalidVersion:
+            return None
+
+
+def is_constraint(revision: str) -> bool:
+    """Check whether a revision is a ^caret or ~tilde version constraint (e.g. ^1.2.3)"""
+    return _version_range(revision) is not None
+
+
+def _version_range(constraint: str) -> Optional[tuple[Any, Any]]:
+    """Return the (lowest, first excluded) versions matched by a ^caret or ~tilde constraint
+
+    Carets allow changes that keep the first non-zero part (^1.2.3 is <2.0.0, ^0.2.3 <0.3.0),
+    tildes changes of the patch version (~1.2.3 is <1.3.0) or the minor one if only the major
+    version is given (~1 is <2).
+    """
+    from packaging.version import InvalidVersion, Version
+
+    constraint = constraint.lstrip("vV")  # versions from pubspec.yaml are prefixed with v
+    if constraint[:1] not in ("^", "~"):
+        return None
+    try:
+        lowest = Version(constraint[1:])
+    except InvalidVersion:
+        return None
+    parts = list(lowest.release)
+    if constraint[0] == "^":
+        bump = next((i for i, part in enumerate(parts) if part), len(parts) - 1)
+    else:
+        bump = min(1, len(parts) - 1)
+    upper = parts[:bump] + [parts[bump] + 1]
+    return lowest, Version(".".join(map(str, upper)))
+
+
+def _changes(diff: pygit2.Diff) -> dict[str, tuple[str, str]]:
+    """Return {path: (old id, new id)} of all deltas of a diff"""
+    return {
+        d.new_file.path: (str(d.old_file.id), str(d.new_file.id))
+        for d in diff.deltas
+        if d.new_file.path
+    }
+
+
+def identity(path: Path) -> str:
+    """Return what tells the repository at `path` apart from other projects across its clones
+
+    That is the URL of its origin remote (or of another one without origin), else the path of
+    its working tree.
+
+    @throws pygit2.GitError if there is no repository at `path`
+    """
+    repository = pygit2.Repository(str(path))
+    urls = {remote.name: remote.url for remote in repository.remotes}
+    url = urls.get("origin") or next((u for u in urls.values() if u), None)
+    return url or str(Path(repository.workdir or repository.path).resolve())
+
+
 class Repo:
     path: Path
     ref: str
@@ -22,20 +99,39 @@ class Repo:
     repo: pygit2.Repository
     _submodules: Optional[dict[Path, str]]
     _diff_cached: bool
+    _changes: Optional[dict[str, tuple[str, str]]]
+    # {normalized version: (tag, commit)} used to resolve versions if set (see tag_index)
+    tag_versions: Optional[dict[str, tuple[str, str]]] = None
+    # libgit2 handles must not be used by several threads at once - users of a shared Repo hold it
+    lock: threading.Lock
     MESSAGE_LIMIT = 250
 
-    def __init__(self, path: Path, ref: Optional[str] = "", bare: bool = False):
+    def __init__(
+        self,
+        path: Path,
+        ref: Optional[str] = "",
+        bare: bool = False,
+        pathspecs: Optional[list[str]] = None,
+    ):
+        """Open a repository at `path` to be diffed against `ref`
+
+        With `pathspecs` (filename globs like "pyproject.toml" or "*.bb") only matching files
+        and submodules are compared, so the cost does not grow with the size of the repository.
+        """
         self.path = path
         self.repo = pygit2.Repository(str(path), pygit2.GIT_REPOSITORY_OPEN_BARE if bare else 0)
         self.bare = bare
+        self.lock = threading.Lock()
+        self.pathspecs = pathspecs
         self._diff_cached = False
+        self._changes = None
+        self._submodules = None
         try:
             self.ref = self._check_ref(ref)
         except KeyError as e:
             if e.args[0] == "HEAD":
                 raise AlrightException("Git first commit")
             raise RuntimeError(f"Revision {e.args[0]} does not exist")
-        self._submodules = None
 
     def __str__(self) -> str:
         return f"{self.path}:{self.ref or 'HEAD'}" + ("#cached" if self._diff_cached else "")
@@ -54,37 +150,133 @@ class Repo:
 
     def changed_files(self) -> list[Path]:
         """List changed filenames in the repository since `self.ref` revision"""
-        try:
-            diffs = self.repo.diff(self.ref, cached=self._diff_cached, context_lines=0)
-        except KeyError:
+        return [Path(s) for s in self._get_changes()]
+
+    def submodule_change(self, submodule_path: Path) -> tuple[str, str]:
+        """Return commit hashes of a submodule before and after the change"""
+        old_version, new_version = self._get_changes().get(submodule_path.as_posix(), ("", ""))
+        if new_version == _NULL_OID and submodule_path in self.submodules:
+            # git does not report what is checked out in the submodule's working tree
+            try:
+                submodule = self.repo.submodules[submodule_path.as_posix()].open()
+                new_version = str(submodule.head.target)
+            except (KeyError, pygit2.GitError):
+                new_version = ""
+        return (old_version, new_version)
+
+    def _get_changes(self) -> dict[str, tuple[str, str]]:
+        """Changed paths since `self.ref` with ids of their old and new content
+
+        The diff is computed only once and shared by all the queries.
+        """
+        if self._changes is None:
+            with timing.span("repo.diff", ref=self.ref):
+                if self.pathspecs is None:
+                    try:
+                        diff = self.repo.diff(self.ref, cached=self._diff_cached, context_lines=0)
+                    except KeyError:
+                        if self.ref == "HEAD":
+                            raise AlrightException("Git first commit")
+                        raise RuntimeError(f"Revision {self.ref} does not exist")
+                    self._changes = _changes(diff)
+                else:
+                    self._changes = self._diff_pathspecs()
+        return self._changes
+
+    def _diff_pathspecs(self) -> dict[str, tuple[str, str]]:
+        """Diff only the files matching `self.pathspecs` using the git binary
+
+        libgit2 (hence pygit2) cannot limit a diff by pathspecs, so it would stat and compare the
+        whole working tree while git skips everything not matching.
+        """
+        assert self.pathspecs is not None
+        pathspecs = [f":(glob)**/{p}" for p in self.pathspecs]
+        pathspecs.extend(f":(literal){p.as_posix()}" for p in self.submodules)
+        cmd = ["git", "-C", str(self.path), "diff", "--raw", "-z", "--abbrev=40", "--no-renames"]
+        if self._diff_cached:
+            cmd.append("--cached")
+        result = subprocess.run(cmd + [self.ref, "--", *pathspecs], capture_output=True)
+        if result.returncode != 0:
             if self.ref == "HEAD":
                 raise AlrightException("Git first commit")
             raise RuntimeError(f"Revision {self.ref} does not exist")
 
-        files: set[str] = set()
-        for diff in diffs:
-            if diff.delta.new_file.path:
-                files.add(diff.delta.new_file.path)
-        return [Path(s) for s in files]
+        changes: dict[str, tuple[str, str]] = {}
+        fields = result.stdout.decode("utf-8").split("\0")
+        for meta, path in zip(fields[0::2], fields[1::2]):
+            _, _, old_id, new_id, _ = meta.split(" ", 4)
+            changes[path] = (old_id, new_id)
+        return changes
 
-    def submodule_change(self, submodule_path: Path) -> tuple[str, str]:
-        """Return list of lines added and removed in the diff"""
+    def history(self, a: str, b: str) -> list[tuple[str, dict[str, tuple[str, str]]]]:
+        """Return commits a..b with their changes of files matching `self.pathspecs`, oldest first
+
+        Only the first parents are followed and every commit is compared to its first parent, so
+        a merge shows everything it brought to the mainline. Commits changing none of the files
+        are left out.
+        """
+        pathspecs = [f":(glob)**/{p}" for p in self.pathspecs or []]
+        pathspecs.extend(f":(literal){p.as_posix()}" for p in self.submodules)
+        cmd = ["git", "-C", str(self.path), "log", "--first-parent", "-m", "--reverse"]
+        cmd += ["--raw", "-z", "--abbrev=40", "--no-renames", "--format=%H", f"{a}..{b}"]
+        result = subprocess.run(cmd + ["--", *pathspecs], capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Range {a}..{b} cannot be walked: {result.stderr.decode().strip()}")
+
+        commits: list[tuple[str, dict[str, tuple[str, str]]]] = []
+        fields = iter(result.stdout.decode("utf-8").split("\0"))
+        for field in fields:
+            field = field.strip("\n")
+            if field.startswith(":"):
+                _, _, old_id, new_id, _ = field.split(" ", 4)
+                commits[-1][1][next(fields)] = (old_id, new_id)
+            elif field:
+                commits.append((field, {}))
+        return commits
+
+    def mainline(self, a: str, b: str) -> list[str]:
+        """Return commits a..b following only the first parents, oldest first"""
+        cmd = ["git", "-C", str(self.path), "rev-list", "--first-parent", "--reverse", f"{a}..{b}"]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Range {a}..{b} cannot be walked: {result.stderr.strip()}")
+        return result.stdout.split()
+
+    def tags(self) -> dict[str, str]:
+        """Return {commit: tag name} of all tags (the last name wins for commits with more)"""
+        tags: dict[str, str] = {}
+        for name in sorted(self.repo.references):
+            if name.startswith("refs/tags/"):
+                try:
+                    commit = self.repo.references[name].peel(pygit2.Commit)
+                except (KeyError, pygit2.GitError, ValueError):
+                    continue  # tags of trees or blobs
+                tags[str(commit.id)] = name[len("refs/tags/") :]
+        return tags
+
+    def get_blob_content(self, id: str) -> str:
+        """Get content of a blob by its id - empty for the null id of missing files"""
+        if id == _NULL_OID:
+            return ""
+        return self.repo[id].peel(pygit2.Blob).data.decode("utf-8")
+
+    def get_content(self, revision: str, path: Path) -> str:
+        """Get content of given filepath on a revision (empty if it does not exist there)"""
+        commit = self.repo.revparse_single(revision).peel(pygit2.Commit)
         try:
-            diffs = self.repo.diff(self.ref, context_lines=0, cached=self._diff_cached)
+            blob = self.repo[commit.tree[path.as_posix()].id].peel(pygit2.Blob)
         except KeyError:
-            raise RuntimeError(f"Revision {self.ref} does not exist")
+            return ""
+        return blob.data.decode("utf-8")
 
-        for diff in diffs:
-            if Path(diff.delta.new_file.path) == submodule_path:
-                old_version = ""
-                new_version = ""
-                for line in diff.hunks[0].lines:
-                    if line.origin == "+":
-                        new_version = line.content.strip().split(" ")[-1]
-                    if line.origin == "-":
-                        old_version = line.content.strip().split(" ")[-1]
-                return (old_version, new_version)
-        return ("", "")
+    def _matches(self, path: str) -> bool:
+        """Check whether a path is matched by `self.pathspecs` (or is a submodule)"""
+        if self.pathspecs is None:
+            return True
+        name = PurePosixPath(path).name
+        return any(fnmatch.fnmatchcase(name, p) for p in self.pathspecs) or (
+            Path(path) in self.submodules
+        )
 
     def get_current_content(self, path: Path) -> str:
         """Get content of given filepath as it is on the disk right now"""
@@ -112,56 +304,178 @@ class Repo:
         if ref and (ref.startswith("HEAD") or ref.startswith("refs/")):
             return ref  # HEAD.* and refs/ qualify as refs
         if ref:
-            try:
-                self.repo.diff("refs/tags/" + ref)
+            if "refs/tags/" + ref in self.repo.references:
                 return "refs/tags/" + ref
-            except KeyError:
-                return "refs/heads/" + ref
-        if self.repo and len(self.repo.diff("HEAD", cached=True)) > 0:
+            return "refs/heads/" + ref
+        # comparing the index with HEAD does not touch the working tree so we can afford it whole
+        staged = self.repo.diff("HEAD", cached=True, context_lines=0)
+        if len(staged) > 0:
             self._diff_cached = True
-            return "HEAD"
-        if self.repo and len(self.repo.diff("HEAD")) > 0:
-            return "HEAD"
+            # the diff that decided about the ref is the one answering all the queries later
+            self._changes = {p: c for p, c in _changes(staged).items() if self._matches(p)}
         return "HEAD"
 
-    def messages(self, a: str, b: Optional[str] = None) -> list[str]:
-        """Get messages between two revisions a and b (in reverse chronological order)
+    def tag_index(self) -> dict[str, tuple[str, str]]:
+        """Return {normalized version: (tag, commit)} of all tags that are versions
 
-        @throws KeyError in case of invalid references
+        With more tags of the same version the first one in alphabetical order wins.
         """
-        logger.debug(f"Getting messages between {a} and {b or self.ref} for {self.path.name}")
+        index: dict[str, tuple[str, str]] = {}
+        for name in sorted(self.repo.references):
+            if not name.startswith("refs/tags/"):
+                continue
+            tag = name[len("refs/tags/") :]
+            version = normalize_version(tag)
+            if version is None or version in index:
+                continue
+            try:
+                commit = self.repo.references[name].peel(pygit2.Commit)
+            except (KeyError, pygit2.GitError, ValueError):
+                continue  # tags of trees or blobs
+            index[version] = (tag, str(commit.id))
+        return index
 
+    def _resolve_version(self, revision: str, lowest: bool = False) -> Optional[str]:
+        """Return the commit of a version (or the highest one matching ^ or ~) from tag_versions
+
+        With `lowest` a ^caret or ~tilde constraint resolves to its lowest matching version.
+        """
+        if not self.tag_versions or re.fullmatch(r"[0-9a-f]{40}", revision):
+            return None
+        bounds = _version_range(revision)
+        if bounds is None:
+            version = normalize_version(revision)
+            return self.tag_versions[version][1] if version in self.tag_versions else None
+
+        from packaging.version import Version
+
+        bottom, excluded = bounds
+        versions = ((Version(v), v) for v in self.tag_versions)
+        matching = {
+            version: v
+            for version, v in versions
+            if bottom <= version < excluded and (not version.is_prerelease or bottom.is_prerelease)
+        }
+        if not matching:
+            return None
+        return self.tag_versions[matching[min(matching) if lowest else max(matching)]][1]
+
+    def resolve(self, revision: str, lowest: bool = False) -> pygit2.Commit:
+        """Return the commit a revision (tag, branch, hash or a version) points to
+
+        Versions are looked up in `tag_versions` first, ^caret and ~tilde constraints resolve to
+        the highest (or `lowest`) matching version there.
+
+        @throws KeyError in case of invalid references
+        """
+        oid = self._resolve_version(revision, lowest)
+        if oid is not None:
+            return self.repo[oid].peel(pygit2.Commit)
         try:
-            past_commit = self.repo.revparse_single(a)
+            obj = self.repo.revparse_single(revision)
         except KeyError:
             # mingled tag -> version name: let's replace first "." in front of a letter with "-"
-            past_commit = self.repo.revparse_single(_v2t(a))
+            obj = self.repo.revparse_single(_v2t(revision))
+        return obj.peel(pygit2.Commit)
+
+    def resolve_range(self, a: str, b: str) -> tuple[pygit2.Commit, pygit2.Commit]:
+        """Return the commits of a range a..b of versions
 
-        b = self.ref if b is None else b
+        A ^caret or ~tilde constraint `a` resolves to its lowest matching version - the range of
+        ^1.2.3..^1.3.0 starts at 1.2.3 (or the first version after it), not at the highest 1.x.
+
+        @throws KeyError in case of invalid references
+        """
+        return self.resolve(a, lowest=True), self.resolve(b)
+
+    def has_revision(self, revision: str) -> bool:
+        """Check whether a revision can be resolved without contacting any remote"""
         try:
-            current_commit = self.repo.revparse_single(b)
-        except KeyError:
-            # mingled tag -> version name: let's replace first "." in front of a letter with "-"
-            current_commit = self.repo.revparse_single(_v2t(b))
+            self.resolve(revision)
+            return True
+        except (KeyError, ValueError, pygit2.GitError):
+            return False
+
+    def is_immutable(self, revision: str) -> bool:
+        """Check whether a revision is a commit hash or a tag (that are not expected to move)"""
+        if len(revision) == 40 and all(c in "0123456789abcdef" for c in revision.lower()):
+            return True
+        return any(f"refs/tags/{tag}" in self.repo.references for tag in (revision, _v2t(revision)))
+
+    def messages(
+        self,
+        a: str,
+        b: Optional[str] = None,
+        limit: Optional[int] = MESSAGE_LIMIT,
+        first_parent: bool = False,
+    ) -> list[str]:
+        """Get messages of commits in range a..b (in reverse topological order) - see commits
+
+        @throws KeyError in case of invalid references
+        """
+        return [commit.message.strip() for commit in self.commits(a, b, limit, first_parent)]
+
+    def commits(
+        self,
+        a: str,
+        b: Optional[str] = None,
+        limit: Optional[int] = MESSAGE_LIMIT,
+        first_parent: bool = False,
+    ) -> list[pygit2.Commit]:
+        """Get commits in range a..b (in reverse topological order)
 
-        if not isinstance(past_commit, pygit2.Commit):
-            past_commit = past_commit.peel(pygit2.Commit)
-        if not isinstance(current_commit, pygit2.Commit):
-            current_commit = current_commit.peel(pygit2.Commit)
+        Only commits reachable from b but not from a are visited, so the cost is proportional to
+        the size of the range. With `first_parent` merged branches are represented just by their
+        merge commits. `limit` caps the number of commits (None or 0 for no limit).
 
-        if past_commit.commit_time > current_commit.commit_time:
+        @throws KeyError in case of invalid references
+        """
+        logger.debug(f"Getting messages between {a} and {b or self.ref} for {self.path.name}")
+
+        past_commit, current_commit = self.resolve_range(a, self.ref if b is None else b)
+
+        # an ancestry check rather than comparing commit times - those lie after rebases or with
+        # skewed clocks, while the generation numbers of the commit-graph make this one cheap
+        if past_commit.id != current_commit.id and self.repo.descendant_of(
+            past_commit.id, current_commit.id
+        ):
             logger.warning(f"Not getting commit messages for downgrade of {self.path.name}")
             return []
 
-        commits = self.repo.walk(current_commit.id)
-        messages: list[str] = []
-        for i, commit in enumerate(commits):
-            if commit.id == past_commit.id:
+        walker = self.repo.walk(current_commit.id, pygit2.enums.SortMode.TOPOLOGICAL)
+        # hiding the past commit hides all its ancestors - our interval is exclusive
+        walker.hide(past_commit.id)
+        if first_parent:
+            walker.simplify_first_parent()
+        commits: list[pygit2.Commit] = []
+        for commit in walker:
+            if limit and len(commits) >= limit:
+                logger.warning(f"Reached limit {limit} commits for {self.path.name}")
                 break
-            if i >= Repo.MESSAGE_LIMIT:
-                logger.warning(f"Reached limit {Repo.MESSAGE_LIMIT} commits for {self.path.name}")
-                break
-            # append only when no end-condition was met - we don't want the last message because
-            # our interval is exclusive
-            messages.append(commit.message.strip())
-        return messages
+            commits.append(commit)
+        return commits
+
+    def first_tags(
+        self, commits: dict[str, list[pygit2.Oid]], walked: set[pygit2.Oid]
+    ) -> dict[str, tuple[str, str]]:
+        """Return {key: (tag, commit)} of the lowest version tag containing any commit of a key
+
+        Only tags on the `walked` commits (of a range, see commits) are considered, keys whose
+        commits are in no such tag are left out. Needs `tag_versions`.
+        """
+        if not self.tag_versions:
+            return {}
+        from packaging.version import Version
+
+        tags = sorted(
+            (Version(v), tag, pygit2.Oid(hex=oid))
+            for v, (tag, oid) in self.tag_versions.items()
+            if pygit2.Oid(hex=oid) in walked
+        )
+        first: dict[str, tuple[str, str]] = {}
+        for key, oids in commits.items():
+            for _, tag, tagged in tags:
+                if any(tagged == oid or self.repo.descendant_of(tagged, oid) for oid in oids):
+                    first[key] = (tag, str(tagged))
+                    break
+        return first
@@ -0,0 +1,109 @@
+"""timing records how long the stages of a gira run take
+
+Code marks its stages with `span` (a no-op until recording is enabled) and the spans are then
+printed as a summary table or written as JSON or a Chrome trace (chrome://tracing, Perfetto).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, TextIO
+
+
+@dataclass(frozen=True)
+class Span:
+    name: str
+    start: float  # seconds since recording was enabled
+    duration: float  # seconds
+    thread: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+
+_enabled = False
+_origin = 0.0
+_spans: list[Span] = []
+_lock = threading.Lock()
+
+
+def enable() -> None:
+    """Start recording spans (dropping previously recorded ones)"""
+    global _enabled, _origin
+    with _lock:
+        _spans.clear()
+        _origin = time.perf_counter()
+        _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def spans() -> list[Span]:
+    with _lock:
+        return list(_spans)
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    """Record the duration of the block as a span called `name` with `args` (e.g. dependency)"""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        recorded = Span(name, start - _origin, end - start, threading.get_ident(), args)
+        with _lock:
+            _spans.append(recorded)
+
+
+def summary(stream: TextIO) -> None:
+    """Print total and maximal durations of spans grouped by name and dependency"""
+    rows: dict[tuple[str, str], list[float]] = {}
+    for s in spans():
+        rows.setdefault((s.name, str(s.args.get("dependency", ""))), []).append(s.duration)
+    width = max([len(name) for name, _ in rows] + [len("stage")])
+    dep_width = max([len(dep) for _, dep in rows] + [len("dependency")])
+    print(
+        f"{'stage':<{width}}  {'dependency':<{dep_width}}  {'count':>5}  {'total':>8}  {'max':>8}",
+        file=stream,
+    )
+    for (name, dep), durations in sorted(rows.items(), key=lambda r: -sum(r[1])):
+        print(
+            f"{name:<{width}}  {dep:<{dep_width}}  {len(durations):>5}  "
+            f"{sum(durations):>7.3f}s  {max(durations):>7.3f}s",
+            file=stream,
+        )
+
+
+def dump(path: Path, format: str = "chrome") -> None:
+    """Write recorded spans to `path` as a Chrome trace (`format` "chrome") or a JSON list"""
+    if format == "json":
+        data: Any = [asdict(s) for s in spans()]
+    elif format == "chrome":
+        pid = os.getpid()
+        data = {
+            "traceEvents": [
+                {
+                    "name": s.name,
+                    "ph": "X",  # complete event
+                    "ts": s.start * 1e6,
+                    "dur": s.duration * 1e6,
+                    "pid": pid,
+                    "tid": s.thread,
+                    "args": s.args,
+                }
+                for s in spans()
+            ],
+            "displayTimeUnit": "ms",
+        }
+    else:
+        raise ValueError(f"Unknown profile format {format}")
+    path.write_text(json.dumps(data, default=str))
@@ -0,0 +1,231 @@
+"""End-to-end benchmarks of gira on synthetic repositories.
+
+Builds upstream repositories with git fast-import (so the same parameters always give the same
+history and commit hashes) served over file:// URLs, a host repository with a west manifest
+bumping all of them from the first to the last tag and runs the gira binary in scenarios:
+
+- cold: empty repository cache
+- warm: everything cached already
+- detail: warm, with ticket summaries from the JIRA stand-in (ticket cache emptied every run)
+- precommit: warm, appending to .git/COMMIT_EDITMSG as the pre-commit hook does
+
+Usage: python tests/bench.py --commits 5000 --deps 4 --output bench.json
+
+The result is JSON with the parameters, the gira version and per scenario the wall times of all
+repetitions and the median time spent in each stage (see gira --profile).
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from jira_standin import JiraStandIn
+
+SCENARIOS = ["cold", "warm", "detail", "precommit"]
+PROJECT = "BENCH"
+
+
+def _git(*args: str, cwd: Path, input: str | None = None) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost", *args],
+        cwd=cwd,
+        input=input,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def history(commits: int, tags: int, merge_every: int, ticket_every: int) -> str:
+    """Return a git fast-import stream of a deterministic history
+
+    Every `merge_every`-th commit merges a side branch commit, every `ticket_every`-th message
+    mentions a ticket and `tags` tags v1.0.0, v1.0.1, ... are spread evenly with the last one
+    on the last commit.
+    """
+    lines: list[str] = []
+    tag_every = max(1, commits // max(1, tags))
+    mark = 0
+
+    def commit(ref: str, message: str, parents: list[int]) -> int:
+        nonlocal mark
+        mark += 1
+        data = message.encode()
+        lines.extend(
+            [
+                f"commit {ref}",
+                f"mark :{mark}",
+                f"committer bench <bench@localhost> {1700000000 + mark} +0000",
+                f"data {len(data)}",
+                message,
+            ]
+        )
+        if parents:
+            lines.append(f"from :{parents[0]}")
+        lines.extend(f"merge :{p}" for p in parents[1:])
+        lines.extend([f"M 644 inline {ref.rsplit('/', 1)[-1]}.txt", "data <<EOF", str(mark), "EOF"])
+        lines.append("")
+        return mark
+
+    head: list[int] = []
+    tag = 0
+    for i in range(commits):
+        ticket = f" {PROJECT}-{i}" if ticket_every and i % ticket_every == 0 else ""
+        if merge_every and i and i % merge_every == 0:
+            side = commit("refs/heads/side", f"feat: side change {i}{ticket}", head)
+            head = [commit("refs/heads/main", f"Merge side branch {i}", [*head, side])]
+        else:
+            head = [commit("refs/heads/main", f"fix: change {i}{ticket}", head)]
+        if i % tag_every == 0 or i == commits - 1:
+            lines.extend([f"reset refs/tags/v1.0.{tag}", f"from :{head[0]}", ""])
+            tag += 1
+    return "\n".join(lines) + "\n"
+
+
+def upstreams(root: Path, count: int, stream: str) -> list[Path]:
+    """Create `count` upstream repositories with the same history and return their paths"""
+    template = root / "template.git"
+    _git("init", "-q", "--bare", str(template), cwd=root)
+    _git("fast-import", "--quiet", cwd=template, input=stream)
+    paths = []
+    for i in range(count):
+        path = root / f"dep{i}.git"
+        _git("clone", "-q", "--bare", str(template), str(path), cwd=root)
+        _git("config", "uploadpack.allowFilter", "true", cwd=path)  # serve partial clones
+        paths.append(path)
+    return paths
+
+
+def host(root: Path, deps: list[Path], files: int, old: str, new: str, jira_url: str) -> Path:
+    """Create a host repository with a staged west.yml bump of all deps and `files` other
+    dependency files (which are not changed)"""
+    path = root / "host"
+    path.mkdir()
+    _git("init", "-q", cwd=path)
+
+    def manifest(revision: str) -> str:
+        projects = "".join(
+            f"  - name: {d.stem}\n    url: file://{d}\n    revision: {revision}\n" for d in deps
+        )
+        return f"manifest:\n  projects:\n{projects}"
+
+    (path / "west.yml").write_text(manifest(old))
+    observe = "".join(f"    {d.stem}: file://{d}\n" for d in deps)
+    (path / ".gira.yaml").write_text(
+        f"observe:\n{observe}jira:\n  url: {jira_url}\n  token: bench\n"
+    )
+    for i in range(files):
+        (path / f"requirements-{i}.txt").write_text(f"package{i}==1.0.{i}\n")
+    _git("add", ".", cwd=path)
+    _git("commit", "-qm", "initial", cwd=path)
+    (path / "west.yml").write_text(manifest(new))
+    _git("add", "west.yml", cwd=path)
+    return path
+
+
+def run(host: Path, cache_dir: Path, arguments: list[str]) -> tuple[float, dict[str, float]]:
+    """Run gira once and return its wall time and total time per stage"""
+    profile = cache_dir.parent / "profile.json"
+    env = {**os.environ, "GIRA_CACHE_DIR": str(cache_dir)}
+    env.pop("CI", None)  # gira does nothing in CI
+    profile.unlink(missing_ok=True)
+    start = time.perf_counter()
+    subprocess.run(
+        # options first - everything after the commit message file belongs to it
+        [sys.executable, "-m", "gira", "--profile", str(profile), *arguments],
+        cwd=host,
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+    elapsed = time.perf_counter() - start
+    stages: dict[str, float] = {}
+    for event in json.loads(profile.read_text())["traceEvents"]:
+        stages[event["name"]] = stages.get(event["name"], 0.0) + event["dur"] / 1e6
+    return elapsed, stages
+
+
+def scenario(name: str, host: Path, cache_dir: Path, repeat: int) -> dict[str, Any]:
+    times: list[float] = []
+    stages: dict[str, list[float]] = {}
+    if name != "cold" and not cache_dir.exists():
+        run(host, cache_dir, ["-c", ".gira.yaml"])  # warm up the cache
+    for _ in range(repeat):
+        arguments = ["-c", ".gira.yaml"]
+        if name == "cold":
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        elif name == "detail":
+            (cache_dir / "jira.json").unlink(missing_ok=True)
+            arguments += ["-f", "detail"]
+        elif name == "precommit":
+            (host / ".git" / "COMMIT_EDITMSG").write_text("bench\n")
+            arguments += [".git/COMMIT_EDITMSG"]
+        elapsed, spans = run(host, cache_dir, arguments)
+        times.append(elapsed)
+        for stage, duration in spans.items():
+            stages.setdefault(stage, []).append(duration)
+    return {
+        "scenario": name,
+        "seconds": times,
+        "median": statistics.median(times),
+        "stages": {stage: statistics.median(d) for stage, d in sorted(stages.items())},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, default=2000, help="commits of each upstream")
+    parser.add_argument("--tags", type=int, default=20, help="tags of each upstream")
+    parser.add_argument("--merge-every", type=int, default=10, help="0 for linear history")
+    parser.add_argument("--ticket-every", type=int, default=3, help="0 for no tickets")
+    parser.add_argument("--deps", type=int, default=4, help="observed upstream repositories")
+    parser.add_argument("--files", type=int, default=20, help="other dependency files in host")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every scenario")
+    parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS))
+    parser.add_argument("--output", type=str, help="write results here instead of stdout")
+    args = parser.parse_args()
+
+    from gira import __version__
+
+    parameters = {
+        k: getattr(args, k)
+        for k in ("commits", "tags", "merge_every", "ticket_every", "deps", "files", "repeat")
+    }
+    tickets = {f"{PROJECT}-{i}": f"Ticket {i}" for i in range(args.commits)}
+    with tempfile.TemporaryDirectory(prefix="gira-bench-") as tmp, JiraStandIn(tickets) as jira:
+        root = Path(tmp)
+        stream = history(args.commits, args.tags, args.merge_every, args.ticket_every)
+        deps = upstreams(root, args.deps, stream)
+        last = sum(1 for line in stream.splitlines() if line.startswith("reset refs/tags/")) - 1
+        repository = host(root, deps, args.files, "v1.0.0", f"v1.0.{last}", jira.url)
+        cache_dir = root / "cache"
+        results = [
+            scenario(name, repository, cache_dir, args.repeat) for name in args.scenarios.split(",")
+        ]
+
+    report = {
+        "gira": __version__,
+        "python": platform.python_version(),
+        "git": _git("--version", cwd=Path(".")),
+        "parameters": parameters,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
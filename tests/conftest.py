@@ -0,0 +1,14 @@
+"""Shared fixtures - no test may touch the cache of the user running them."""
+
+import pytest
+
+from gira import cache
+
+
+@pytest.fixture(autouse=True)
+def gira_cache_dir(tmp_path, monkeypatch):
+    """Cache in the temporary directory of the test (also in gira processes it starts)"""
+    path = tmp_path / ".gira_cache"
+    monkeypatch.setenv("GIRA_CACHE_DIR", str(path))
+    monkeypatch.setattr(cache, "CACHE_DIR", path)
+    return path
@@ -0,0 +1,122 @@
+"""A tiny local HTTP stand-in for the JIRA REST API used by gira's tests.
+
+It serves just enough of /rest/api/2 for python-jira to connect, search issues
+with JQL (``key in (...)``) and get single issues. Every request path is
+recorded so tests can assert how many round trips gira made.
+"""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+_KEY_RE = re.compile(r"[A-Z]+-\d+")
+
+
+class JiraStandIn:
+    """Run with `with JiraStandIn({"OCD-1": "summary"}) as jira: jira.url ...`"""
+
+    def __init__(
+        self,
+        issues: Optional[dict[str, str]] = None,
+        max_results: int = 1000,
+        strict: bool = False,
+    ):
+        self.issues = dict(issues or {})
+        self.max_results = max_results
+        self.strict = strict  # refuse searches for unknown keys with 400 as Jira does
+        self.search_status: Optional[int] = None  # fail every search with this status
+        self.requests: list[str] = []
+        self.connections: set[tuple[str, int]] = set()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def searches(self) -> list[str]:
+        return [r for r in self.requests if r.startswith("/rest/api/2/search")]
+
+    def __enter__(self) -> "JiraStandIn":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _issue(self, key: str) -> dict:
+        return {
+            "key": key,
+            "id": key,
+            "self": f"{self.url}/rest/api/2/issue/{key}",
+            "fields": {"summary": self.issues[key]},
+        }
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse connections
+
+            def log_message(self, *_):
+                pass
+
+            def _json(self, data, status: int = 200):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                standin.requests.append(self.path)
+                standin.connections.add(self.client_address)
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == "/rest/api/2/serverInfo":
+                    return self._json(
+                        {
+                            "baseUrl": standin.url,
+                            "version": "9.4.0",
+                            "versionNumbers": [9, 4, 0],
+                            "deploymentType": "Server",
+                        }
+                    )
+                if url.path == "/rest/api/2/field":
+                    return self._json([{"id": "summary", "name": "Summary"}])
+                if url.path == "/rest/api/2/search":
+                    keys = _KEY_RE.findall(query.get("jql", [""])[0])
+                    if standin.search_status is not None:
+                        return self._json({"errorMessages": ["Failed"]}, standin.search_status)
+                    unknown = [k for k in keys if k not in standin.issues]
+                    if standin.strict and unknown:
+                        message = (
+                            f"An issue with key '{unknown[0]}' does not exist for field 'key'."
+                        )
+                        return self._json({"errorMessages": [message]}, 400)
+                    start = int(query.get("startAt", ["0"])[0])
+                    limit = min(int(query.get("maxResults", ["50"])[0]), standin.max_results)
+                    found = [standin._issue(k) for k in keys if k in standin.issues]
+                    return self._json(
+                        {
+                            "startAt": start,
+                            "maxResults": limit,
+                            "total": len(found),
+                            "issues": found[start : start + limit],
+                        }
+                    )
+                if url.path.startswith("/rest/api/2/issue/"):
+                    key = url.path.rsplit("/", 1)[-1]
+                    if key in standin.issues:
+                        return self._json(standin._issue(key))
+                    return self._json({"errorMessages": ["Issue does not exist"]}, 404)
+                return self._json({"errorMessages": [f"Unknown path {url.path}"]}, 404)
+
+        return Handler
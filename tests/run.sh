@@ -1,6 +1,8 @@
 set -ex
 
 export GIRA_TEST_ROOT=$PWD
+# keep the repository cache next to the test repository so each test starts afresh
+export GIRA_CACHE_DIR=.gira_cache
 
 #### Prepare the test #######################
 ## Untar git remote for the tests
@@ -10,7 +12,7 @@ tar -xf dep1.tar
 popd
 
 rm -rf local
-mkdir -p local/poetry local/dynamic
+mkdir -p local/poetry local/dynamic local/kas
 envsubst < local-template/poetry/pyproject.toml > local/poetry/pyproject.toml
 envsubst < local-template/poetry/poetry.lock > local/poetry/poetry.lock
 envsubst < local-template/pyproject.toml > local/pyproject.toml
@@ -21,6 +23,9 @@ envsubst < local-template/.gira.yaml > local/.gira.yaml
 envsubst < local-template/prefix.yaml > local/prefix.yaml
 envsubst < local-template/dynamic/pyproject.toml > local/dynamic/pyproject.toml
 envsubst < local-template/dynamic/requirements.txt > local/dynamic/requirements.txt
+envsubst < local-template/kas.yaml > local/kas.yaml
+envsubst < local-template/kas/board.yml > local/kas/board.yml
+envsubst < local-template/kas/common.yml > local/kas/common.yml
 
 
 function not_contains {
@@ -135,6 +140,28 @@ grep OCD-1234 output.txt
 not_contains OCD-567 output.txt
 
 
+echo "-- Test KAS included file"
+git reset --hard $INITIAL_COMMIT
+rm -rf .gira_cache output.txt
+# v1.0.0 -> v1.1.0 in the file included by kas/board.yml
+sed -i 's/ac804edac73e0494cbfabc8fc1b33c5b1aeafffe/42c27a3e66153a4a5f6317e8adbc4a8d17dad99c/' kas/common.yml
+gira -c kas.yaml > output.txt
+grep dep1-kas output.txt
+grep OCD-1234 output.txt
+not_contains OCD-567 output.txt
+
+
+echo "-- Test KAS override of an included repo"
+git reset --hard $INITIAL_COMMIT
+rm -rf .gira_cache output.txt
+# v1.0.0 (from the include in the old revision) -> v1.1.1 (overridden by board.yml)
+printf "  dep1-kas:\n    commit: 8abae70f337d764e3ffa2ef0637c9eda24d25250\n" >> kas/board.yml
+gira -c kas.yaml > output.txt
+grep dep1-kas output.txt
+grep OCD-1234 output.txt
+grep OCD-567 output.txt
+
+
 echo "-- Test JIRA key prefix filtering"
 git reset --hard $INITIAL_COMMIT
 rm -rf .gira_cache output.txt
@@ -203,6 +230,80 @@ grep OCD-1234 output.txt  # classic check for move to version 1.1.0 but not to 1
 not_contains OCD-567 output.txt
 
 
+echo "-- Test --offline"
+git reset --hard $INITIAL_COMMIT
+rm -rf .gira_cache output.txt
+sed -i 's/1.0.0/1.1.0/g' west.yml
+gira -c west.yml --offline > output.txt  # nothing cached yet
+not_contains OCD-1234 output.txt
+gira -c west.yml > /dev/null
+gira -c west.yml --offline > output.txt  # served from the cache
+grep OCD-1234 output.txt
+
+
+echo "-- Test --timings and --profile"
+git reset --hard $INITIAL_COMMIT
+rm -rf .gira_cache output.txt profile.json
+sed -i 's/1.0.0/1.1.0/g' west.yml
+gira -c west.yml --timings --profile profile.json > output.txt 2> timings.txt
+grep OCD-1234 output.txt
+grep "cache.clone" timings.txt
+grep "messages" timings.txt
+grep traceEvents profile.json
+rm -f profile.json timings.txt
+
+
+echo "-- Test json output"
+git reset --hard $INITIAL_COMMIT
+rm -rf output.txt
+sed -i 's/1.0.0/1.1.0/g' west.yml
+gira -c west.yml --format ndjson > output.txt
+python -c 'import json, sys; [r] = map(json.loads, open("output.txt")); assert r["new_version"] == "v1.1.0" and len(r["new_oid"]) == 40 and "OCD-1234" in [t["name"] for t in r["tickets"]], r'
+gira -c west.yml --format json > output.txt
+python -c 'import json; [r] = json.load(open("output.txt")); assert r["name"] == "dep1-west", r'
+
+
+echo "-- Test --range"
+git reset --hard $INITIAL_COMMIT
+rm -rf output.txt
+sed -i 's/1.0.0/1.1.0/g' west.yml
+git commit -qam "Bump dep1"
+gira -c west.yml --range $INITIAL_COMMIT..HEAD --format markdown > output.txt
+grep "^## [0-9a-f]\{7\} Bump dep1" output.txt
+grep OCD-1234 output.txt
+if gira -c west.yml -r HEAD --range $INITIAL_COMMIT..HEAD; then exit 1; fi  # one or the other
+gira -c west.yml find OCD-1234 > output.txt
+grep "OCD-1234: dep1-west v1.1.0 (in [0-9a-f]\{7\} Bump dep1)" output.txt
+if gira -c west.yml find NOPE-1; then exit 1; fi  # unknown tickets fail like grep
+# another project sharing the cache did not ship it
+OTHER=$(mktemp -d)
+git init -q "$OTHER"
+CACHE=$PWD/.gira_cache
+if (cd "$OTHER" && GIRA_CACHE_DIR=$CACHE gira find OCD-1234); then exit 1; fi
+rm -rf "$OTHER"
+git reset --hard $INITIAL_COMMIT
+
+
+echo "-- Test --daemon"
+git reset --hard $INITIAL_COMMIT
+rm -rf .gira_cache output.txt
+export GIRA_SOCKET=$PWD/gira.sock
+gira --daemon 2> daemon.txt &
+DAEMON=$!
+for i in $(seq 50); do [ -S gira.sock ] && break; sleep 0.1; done
+sed -i 's/1.0.0/1.1.0/g' west.yml
+gira -c west.yml -v > output.txt 2> client.txt
+grep OCD-1234 output.txt
+grep "Running gira -c west.yml -v" daemon.txt  # the daemon did the run
+grep "Changed files" client.txt  # and sent its log to the client
+[ "$(grep -c 'Changed files' daemon.txt)" = 0 ]
+kill $DAEMON
+wait $DAEMON
+[ ! -e gira.sock ]
+unset GIRA_SOCKET
+rm -f daemon.txt client.txt
+
+
 echo "-- Test pre-commit"
 git reset --hard $INITIAL_COMMIT
 rm -rf .gira_cache output.txt
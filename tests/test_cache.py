@@ -0,0 +1,362 @@
+"""Unit tests for gira.cache - caching of observed repositories in local bare clones.
+
+The upstream repositories are created on the fly with the git binary, so only
+``git`` is needed on top of the installed ``gira`` package.
+"""
+
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from gira import cache, core
+
+
+def _git(*args: str, cwd: Path) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def _upstream(path: Path, messages: list[str]) -> Path:
+    """Create a repository with one commit (tagged v1.0.<i>) per message"""
+    path.mkdir()
+    _git("init", "-q", cwd=path)
+    for i, message in enumerate(messages):
+        (path / "file.txt").write_text(message)
+        _git("add", ".", cwd=path)
+        _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", message, cwd=path)
+        _git("tag", f"v1.0.{i}", cwd=path)
+    return path
+
+
+def _cached(cache_dir: Path, name: str) -> Path:
+    """Return the cached clone of the upstream repository `name` (keyed by its URL)"""
+    (repo_dir,) = cache_dir.glob(f"{name}-*.git")
+    return repo_dir
+
+
+@pytest.fixture
+def cache_dir(gira_cache_dir):
+    return gira_cache_dir
+
+
+def test_cache_all_clones_every_upgrade(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    b = _upstream(tmp_path / "b", ["initial", "fix: B-2"])
+    upgrades = [
+        core.Upgrade(name="a", old_version="v1.0.0", new_version="v1.0.1"),
+        core.Upgrade(name="b", old_version="v1.0.0", new_version="v1.0.1"),
+    ]
+    repositories = cache.cache_all(
+        upgrades, {"a": f"file://{a}/.git", "b": f"file://{b}/.git"}, jobs=2
+    )
+    assert set(repositories) == {"a", "b"}
+    assert repositories["a"].messages("v1.0.0", "v1.0.1") == ["feat: A-1"]
+    assert repositories["b"].messages("v1.0.0", "v1.0.1") == ["fix: B-2"]
+    assert (_cached(cache_dir, "a")).is_dir()
+
+
+def test_cache_all_failure_does_not_stop_others(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    upgrades = [
+        core.Upgrade(name="a", old_version="v1.0.0", new_version="v1.0.1"),
+        core.Upgrade(name="missing", old_version="v1.0.0", new_version="v1.0.1"),
+        core.Upgrade(name="unknown", old_version="v1.0.0", new_version="v1.0.1"),
+    ]
+    observe = {"a": f"file://{a}/.git", "missing": f"file://{tmp_path / 'nope'}"}
+    repositories = cache.cache_all(upgrades, observe, jobs=3)
+    assert set(repositories) == {"a"}
+
+
+def test_cache_all_uses_url_from_dependency_file(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial"])
+    upgrade = core.Upgrade(name="a", old_version="v1.0.0", repository=f"file://{a}/.git")
+    assert set(cache.cache_all([upgrade], {})) == {"a"}
+
+
+def _fetched(cache_dir: Path, name: str) -> float:
+    return cache._read_metadata(_cached(cache_dir, name))["fetched"]
+
+
+def test_cache_skips_fetch_when_revisions_are_cached(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    cache.cache("a", f"file://{a}/.git")
+    fetched = _fetched(cache_dir, "a")
+    cache.cache("a", f"file://{a}/.git", ["v1.0.0", "v1.0.1"])
+    assert _fetched(cache_dir, "a") == fetched
+
+
+def test_cache_fetches_missing_revision(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    cache.cache("a", f"file://{a}/.git")
+    (a / "file.txt").write_text("new")
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qam", "fix: A-2", cwd=a)
+    _git("tag", "v1.1.0-rc.1", cwd=a)
+    # python mangles the tag to 1.1.0.rc.1 which must be resolved through repo._v2t
+    repository = cache.cache("a", f"file://{a}/.git", ["v1.0.1", "v1.1.0.rc.1"])
+    assert repository.messages("v1.0.1", "v1.1.0.rc.1") == ["fix: A-2"]
+
+
+def test_cache_fetches_after_ttl(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial"])
+    cache.cache("a", f"file://{a}/.git")
+    fetched = _fetched(cache_dir, "a")
+    cache.cache("a", f"file://{a}/.git", ["v1.0.0"], ttl=0)
+    assert _fetched(cache_dir, "a") > fetched
+
+
+def test_stored_tickets(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    url = f"file://{a}/.git"
+    repository = cache.cache("a", url)
+    pattern = re.compile(r"(?P<ticket>[A-Z]+-\d+)")
+    assert cache.stored_tickets(url, "v1.0.0", "v1.0.1", pattern) is None
+    assert cache.stored_tickets(url, "v1.0.0", "v1.0.1", pattern, repository) is None
+
+    cache.store_tickets(url, repository, "v1.0.0", "v1.0.1", pattern, ["A-1"])
+    # tags do not move so the result is found even without the repository
+    assert cache.stored_tickets(url, "v1.0.0", "v1.0.1", pattern) == ["A-1"]
+    # the same commits under a different name (a mangled tag) hit the same result
+    head = _git("rev-parse", "v1.0.1", cwd=a)
+    assert cache.stored_tickets(url, "v1.0.0", head, pattern, repository) == ["A-1"]
+    # a different pattern is a different result
+    assert cache.stored_tickets(url, "v1.0.0", "v1.0.1", re.compile("(B-1)")) is None
+
+
+def test_stored_tickets_of_moving_revision_need_repository(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    url = f"file://{a}/.git"
+    repository = cache.cache("a", url)
+    pattern = re.compile(r"(?P<ticket>[A-Z]+-\d+)")
+    branch = _git("branch", "--show-current", cwd=a)
+    cache.store_tickets(url, repository, "v1.0.0", branch, pattern, ["A-1"])
+    assert cache.stored_tickets(url, "v1.0.0", branch, pattern) is None
+    assert cache.stored_tickets(url, "v1.0.0", branch, pattern, repository) == ["A-1"]
+
+
+def test_stored_tickets_are_kept_per_repository(tmp_path, cache_dir):
+    # two projects observing different repositories under the same name share the cache
+    (tmp_path / "first").mkdir()
+    (tmp_path / "second").mkdir()
+    first = _upstream(tmp_path / "first" / "a", ["initial", "feat: A-1"])
+    second = _upstream(tmp_path / "second" / "a", ["initial", "feat: B-1"])
+    pattern = re.compile(r"(?P<ticket>[A-Z]+-\d+)")
+    for path, tickets in ((first, ["A-1"]), (second, ["B-1"])):
+        url = f"file://{path}/.git"
+        cache.store_tickets(url, cache.cache("a", url), "v1.0.0", "v1.0.1", pattern, tickets)
+    assert cache.stored_tickets(f"file://{first}/.git", "v1.0.0", "v1.0.1", pattern) == ["A-1"]
+    assert cache.stored_tickets(f"file://{second}/.git", "v1.0.0", "v1.0.1", pattern) == ["B-1"]
+
+
+def _commit_graph(cache_dir: Path, name: str) -> Path:
+    return _cached(cache_dir, name) / "objects" / "info" / "commit-graph"
+
+
+def test_cache_writes_commit_graph(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    cache.cache("a", f"file://{a}/.git")
+    # a single graph file (no --split chain) as libgit2 reads only that one
+    assert _commit_graph(cache_dir, "a").is_file()
+    chain = _commit_graph(cache_dir, "a").parent / "commit-graphs" / "commit-graph-chain"
+    assert not chain.exists()
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "--allow-empty",
+         "-m", "fix: A-2", cwd=a)  # fmt: skip
+    _git("tag", "v1.1.0", cwd=a)
+    cache.cache("a", f"file://{a}/.git", ["v1.1.0"])
+    # the fetched commit is in the graph, which has to verify against the fetched objects
+    repo_dir = _cached(cache_dir, "a")
+    _git("--git-dir", str(repo_dir), "commit-graph", "verify", cwd=tmp_path)
+    tip = _git("--git-dir", str(repo_dir), "rev-parse", "v1.1.0^{commit}", cwd=tmp_path)
+    assert bytes.fromhex(tip) in _commit_graph(cache_dir, "a").read_bytes()
+
+
+def _missing_objects(repo_dir: Path) -> list[str]:
+    # --missing=print lists objects a partial clone does not have without fetching them
+    out = _git("--git-dir", str(repo_dir), "rev-list", "--objects", "--missing=print", "--all",
+               cwd=repo_dir)  # fmt: skip
+    return [line for line in out.splitlines() if line.startswith("?")]
+
+
+def test_cache_clones_without_trees(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    _git("config", "uploadpack.allowFilter", "true", cwd=a)
+    repository = cache.cache("a", f"file://{a}/.git")
+    assert repository.messages("v1.0.0", "v1.0.1") == ["feat: A-1"]
+    assert len(_missing_objects(_cached(cache_dir, "a"))) == 2  # trees of both commits
+    # git still gets the content on demand
+    assert (
+        _git("--git-dir", str(_cached(cache_dir, "a")), "show", "v1.0.0:file.txt", cwd=a)
+        == "initial"
+    )
+
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "--allow-empty",
+         "-m", "fix: A-2", cwd=a)  # fmt: skip
+    _git("tag", "v1.1.0", cwd=a)
+    repository = cache.cache("a", f"file://{a}/.git", ["v1.1.0"])
+    assert repository.messages("v1.0.1", "v1.1.0") == ["fix: A-2"]
+    # fetches keep the filter of the clone
+    assert len(_missing_objects(_cached(cache_dir, "a"))) == 1
+
+
+def test_cache_full_clone(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    _git("config", "uploadpack.allowFilter", "true", cwd=a)
+    cache.cache("a", f"file://{a}/.git", filter=None)
+    assert _missing_objects(_cached(cache_dir, "a")) == []
+
+
+def _refs(repo_dir: Path) -> set[str]:
+    return set(_git("--git-dir", str(repo_dir), "for-each-ref", "--format=%(refname)",
+                    cwd=repo_dir).split())  # fmt: skip
+
+
+def test_cache_fetches_only_needed_refs(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial"])
+    cache.cache("a", f"file://{a}/.git")
+    for i, message in enumerate(["feat: A-1", "fix: A-2", "fix: A-3"], 1):
+        _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "--allow-empty",
+             "-m", message, cwd=a)  # fmt: skip
+        _git("tag", f"v1.{i}.0" if i != 2 else "v1.2.0-rc.1", cwd=a)
+    _git("branch", "unrelated", cwd=a)
+    pin = _git("rev-parse", "HEAD~2", cwd=a)
+
+    # python mangles v1.2.0-rc.1 which is fetched by its tag name
+    repository = cache.cache("a", f"file://{a}/.git", ["v1.0.0", "v1.2.0.rc.1", pin])
+    assert repository.messages(pin, "v1.2.0.rc.1") == ["fix: A-2"]
+    refs = _refs(_cached(cache_dir, "a"))
+    assert "refs/tags/v1.2.0-rc.1" in refs and f"refs/gira/{pin}" in refs
+    assert "refs/tags/v1.3.0" not in refs and "refs/heads/unrelated" not in refs
+
+
+def test_cache_falls_back_to_full_fetch(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial"])
+    cache.cache("a", f"file://{a}/.git")
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "--allow-empty",
+         "-m", "feat: A-1", cwd=a)  # fmt: skip
+    _git("tag", "v1.1.0", cwd=a)
+    # an abbreviated hash cannot be fetched directly
+    short = _git("rev-parse", "--short", "HEAD", cwd=a)
+    repository = cache.cache("a", f"file://{a}/.git", [short])
+    assert repository.messages("v1.0.0", short) == ["feat: A-1"]
+    assert "refs/tags/v1.1.0" in _refs(_cached(cache_dir, "a"))
+
+
+def test_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("GIRA_CACHE_DIR", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    assert cache.cache_dir() == tmp_path / "xdg" / "gira"
+    assert cache.cache_dir("~/gira") == Path.home() / "gira"
+    monkeypatch.setenv("GIRA_CACHE_DIR", str(tmp_path / "env"))
+    assert cache.cache_dir("~/gira") == tmp_path / "env"
+
+
+def test_cache_concurrently(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    # a leftover of an interrupted clone does not matter
+    _, key = cache._cache_key(f"file://{a}/.git", {})
+    (cache_dir / f"{key}.git.tmp").mkdir(parents=True)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(cache.cache, "a", f"file://{a}/.git", ["v1.0.1"])
+                   for _ in range(4)]  # fmt: skip
+        for future in futures:
+            assert future.result().messages("v1.0.0", "v1.0.1") == ["feat: A-1"]
+    assert sorted(p.name for p in cache_dir.iterdir()) == [
+        f"{key}.git",
+        f"{key}.json",
+        f"{key}.lock",
+    ]
+
+
+def test_cache_all_shares_clone_of_same_url(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "feat: A-1"])
+    upgrades = [
+        core.Upgrade(name="a", old_version="v1.0.0", new_version="v1.0.1"),
+        core.Upgrade(name="a-too", old_version="v1.0.0", new_version="v1.0.1"),
+    ]
+    repositories = cache.cache_all(upgrades, {"a": f"file://{a}/.git", "a-too": f"{a}/"})
+    assert repositories["a"].path == repositories["a-too"].path
+    assert cache._read_metadata(_cached(cache_dir, "a"))["names"] == ["a", "a-too"]
+
+
+def _fork(upstream: Path, path: Path, message: str) -> Path:
+    _git("clone", "-q", str(upstream), str(path), cwd=upstream.parent)
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "--allow-empty",
+         "-m", message, cwd=path)  # fmt: skip
+    _git("tag", "v2.0.0", cwd=path)
+    return path
+
+
+def test_cache_all_shares_objects_of_forks(tmp_path, cache_dir):
+    upstream = _upstream(tmp_path / "zephyr", ["initial", "feat: Z-1"])
+    (tmp_path / "nrf").mkdir()
+    fork = _fork(upstream, tmp_path / "nrf" / "zephyr", "feat: NRF-1")
+    sdk = _fork(upstream, tmp_path / "sdk-zephyr", "feat: SDK-1")
+    upgrades = [
+        core.Upgrade(name=name, old_version="v1.0.1", new_version="v2.0.0")
+        for name in ("fork", "sdk", "upstream")
+    ]
+    observe = {"upstream": f"file://{upstream}/.git", "fork": f"file://{fork}/.git",
+               "sdk": f"file://{sdk}/.git"}  # fmt: skip
+    cache.cache("upstream", observe["upstream"])
+    repositories = cache.cache_all(upgrades, observe, related={"sdk-zephyr": "zephyr"})
+    assert repositories["fork"].messages("v1.0.1", "v2.0.0") == ["feat: NRF-1"]
+    assert repositories["sdk"].messages("v1.0.1", "v2.0.0") == ["feat: SDK-1"]
+    # all but one commit of both come from the object store of the first clone
+    for name in ("fork", "sdk"):
+        alternates = repositories[name].path / "objects" / "info" / "alternates"
+        assert alternates.read_text().strip() == str(
+            (cache_dir / f"{cache._cache_key(observe['upstream'], {})[1]}.git/objects").resolve()
+        )
+
+
+def test_cache_all_failure_of_fork_does_not_stop_its_family(tmp_path, cache_dir):
+    upstream = _upstream(tmp_path / "zephyr", ["initial", "feat: Z-1"])
+    upgrades = [
+        core.Upgrade(name=name, old_version="v1.0.0", new_version="v1.0.1")
+        for name in ("bad", "bad-too", "upstream")
+    ]
+    bad = f"file://{tmp_path}/missing/zephyr"
+    observe = {"bad": bad, "bad-too": bad, "upstream": f"file://{upstream}/.git"}
+    futures = cache.submit_all(upgrades, observe)
+    assert futures["bad"].exception() is futures["bad-too"].exception() is not None
+    assert futures["upstream"].result().messages("v1.0.0", "v1.0.1") == ["feat: Z-1"]
+
+
+def test_cache_fetches_new_tags_of_constraints_after_ttl(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "fix: A-1"])
+    repository = cache.cache("a", f"file://{a}/.git", ["^1.0.0"])
+    assert repository.messages("^1.0.0", "^1.0.0") == ["fix: A-1"]
+    (a / "file.txt").write_text("fix: A-2")
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qam", "fix: A-2", cwd=a)
+    _git("tag", "v1.0.2", cwd=a)
+    # the highest matching version is cached, but a newer one may have been released since
+    repository = cache.cache("a", f"file://{a}/.git", ["^1.0.0"], ttl=0)
+    assert repository.messages("^1.0.0", "^1.0.0") == ["fix: A-2", "fix: A-1"]
+
+
+def test_names_of_a_repository_share_its_handle_in_turns(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "fix: A-1"])
+    repository = cache.cache("a", f"file://{a}/.git")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with repository.lock:  # walked by another thread
+            future = executor.submit(cache.cache, "b", f"file://{a}/.git", ["v1.0.1"])
+            with pytest.raises(TimeoutError):
+                future.result(timeout=0.2)
+        assert future.result() is repository
+
+
+def test_tag_index_is_kept_in_metadata(tmp_path, cache_dir):
+    a = _upstream(tmp_path / "a", ["initial", "fix: A-1", "fix: A-2"])
+    repository = cache.cache("a", f"file://{a}/.git", ["v1.0.0", "v1.0.2"])
+    metadata = cache._read_metadata(_cached(cache_dir, "a"))
+    assert metadata["tags"]["1.0.2"] == ["v1.0.2", _git("rev-parse", "v1.0.2", cwd=a)]
+    assert repository.messages("1.0.0", "^1.0.0") == ["fix: A-2", "fix: A-1"]
+
+    # a new process opens the repository with the index from the metadata
+    cache._repositories.clear()
+    reopened = cache.cache("a", f"file://{a}/.git", ["1.0.1"], offline=True)
+    assert reopened is not repository
+    assert reopened.tag_versions == repository.tag_versions
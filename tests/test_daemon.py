@@ -0,0 +1,90 @@
+"""Unit tests for gira.daemon - forwarding runs to a long-lived gira process."""
+
+import logging
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from gira import __version__, daemon, logger
+
+
+def _run(argv: list[str]) -> int:
+    """Stand-in for a gira run reporting what it was run with"""
+    print(f"{Path.cwd().name} {argv} {os.environ.get('GIRA_TEST')}")
+    logger.warning("from the daemon")
+    if argv == ["--bad"]:
+        sys.exit(2)
+    return 3
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = daemon.Server(tmp_path / "gira.sock", _run)
+    handler = daemon._CurrentStderr()
+    logging.getLogger().addHandler(handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    logging.getLogger().removeHandler(handler)
+
+
+def test_forward_without_daemon(tmp_path):
+    assert daemon.forward(["-v"], tmp_path / "missing.sock") is None
+    (tmp_path / "stale.sock").touch()
+    assert daemon.forward(["-v"], tmp_path / "stale.sock") is None
+
+
+def test_forward(server, tmp_path, monkeypatch, capsys):
+    (tmp_path / "project").mkdir()
+    monkeypatch.chdir(tmp_path / "project")
+    monkeypatch.setenv("GIRA_TEST", "forwarded")
+    cwd = os.getcwd()
+    assert daemon.forward(["-c", "west.yml"], Path(server.server_address)) == 3
+    out, err = capsys.readouterr()
+    assert out == "project ['-c', 'west.yml'] forwarded\n"
+    assert "from the daemon" in err
+    # the daemon gets back to where it was
+    assert os.getcwd() == cwd
+
+
+def test_forward_exit(server, capsys):
+    assert daemon.forward(["--bad"], Path(server.server_address)) == 2
+
+
+def test_other_version_is_refused(server, tmp_path):
+    request = {"version": "0.0.0", "argv": [], "cwd": str(tmp_path), "env": {}}
+    assert server.answer(request) == {"error": f"the daemon runs gira {__version__}"}
+
+
+def test_answer_restores_environment(server, tmp_path, monkeypatch):
+    monkeypatch.setenv("GIT_INDEX_FILE", "daemon")
+    request = {"version": __version__, "argv": [], "cwd": str(tmp_path), "env": {"GIRA_TEST": "x"}}
+    assert server.answer(request)["stdout"] == f"{tmp_path.name} [] x\n"
+    assert os.environ["GIT_INDEX_FILE"] == "daemon" and "GIRA_TEST" not in os.environ
+    assert "error" in server.answer({**request, "cwd": str(tmp_path / "missing")})
+
+
+def test_socket_path_is_in_a_private_directory(monkeypatch, tmp_path):
+    monkeypatch.delenv("GIRA_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert daemon.socket_path() == tmp_path / f"gira-{os.getuid()}.sock"
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    monkeypatch.setattr(daemon.tempfile, "gettempdir", lambda: str(tmp_path))
+    assert daemon.socket_path() == tmp_path / f"gira-{os.getuid()}" / "gira.sock"
+
+
+def test_foreign_socket_is_not_used(server, tmp_path, monkeypatch, capsys):
+    path = Path(server.server_address)
+    assert daemon.is_private(path)
+    tmp_path.chmod(0o777)  # others could have put the socket there
+    assert daemon.forward(["-v"], path) is None
+    tmp_path.chmod(0o700)
+    monkeypatch.setattr(daemon.os, "getuid", lambda: os.stat(path).st_uid + 1)
+    assert daemon.forward(["-v"], path) is None
+    assert daemon.serve(_run, path) == 1
+    assert capsys.readouterr().out == ""  # nothing was run
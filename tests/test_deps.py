@@ -5,9 +5,11 @@ after ``pip install -e .[dev]`` or against the built package, never by adding
 ``src`` to the path.
 """
 
+import fnmatch
 from pathlib import Path
 
 import pytest
+import yaml
 
 from gira import deps
 
@@ -36,6 +38,11 @@ def test_is_parsable_true(name):
     assert deps.is_parsable(Path("some/sub/dir") / name)
 
 
+def test_filename_globs_cover_parsable_files():
+    for name in ["pyproject.toml", "requirements-dev.txt", "pubspec.yaml", "west-x.yml"]:
+        assert any(fnmatch.fnmatchcase(name, glob) for glob in deps.FILENAME_GLOBS)
+
+
 @pytest.mark.parametrize(
     "name",
     ["setup.py", "README.md", "poetry.lock", "foo.txt", "requirements.cfg", "pubspec.json"],
@@ -59,6 +66,12 @@ def test_parse_unknown_file_raises():
         deps.parse(Path("unknown.lock"), "", {})
 
 
+def test_parse_yaml_that_is_no_kas_document():
+    # a revision of a KAS file that is not (yet) a complete KAS document
+    assert deps.parse(Path("board.yml"), "header: {version: 14}\nmachine: x\n", {}) == {}
+    assert deps.parse(Path("board.yml"), "", {}) == {}
+
+
 # --------------------------------------------------------------------------- #
 # _requirement_version - the shared PEP 508 line parser
 # --------------------------------------------------------------------------- #
@@ -269,3 +282,77 @@ def test_section_nested_lookup():
 def test_section_missing_returns_empty_dict():
     assert deps._section({"tool": {}}, "tool.gira.observe") == {}
     assert deps._section({}, "a.b.c") == {}
+
+
+# --------------------------------------------------------------------------- #
+# is_kas_yaml / load_yaml
+# --------------------------------------------------------------------------- #
+KAS_CONTENT = """
+header:
+  version: 14
+repos:
+  meta-dronetag:
+    url: git@bitbucket.org:dronetag/linux-dt.git
+    commit: debad50cbb365f96594af5e4bdf53cc6dc095935
+"""
+
+
+def test_is_kas_yaml(tmp_path):
+    kas = tmp_path / "board.yml"
+    kas.write_text(KAS_CONTENT)
+    assert deps.is_kas_yaml(kas)
+    assert deps.is_parsable(kas)
+
+
+def test_is_kas_yaml_prefilter_skips_parsing(tmp_path, monkeypatch):
+    ci = tmp_path / "ci.yml"
+    ci.write_text("jobs:\n  build:\n    header: nested keys do not count\nrepos: x\n")
+    monkeypatch.setattr(yaml, "load", lambda *_, **__: pytest.fail("parsed"))
+    assert not deps.is_kas_yaml(ci)
+
+
+def test_is_kas_yaml_document_is_parsed_once(tmp_path, monkeypatch):
+    kas = tmp_path / "once.yml"
+    kas.write_text(KAS_CONTENT + "# once\n")
+    assert deps.is_kas_yaml(kas)
+    monkeypatch.setattr(yaml, "load", lambda *_, **__: pytest.fail("parsed again"))
+    assert deps.load_yaml(kas.read_text())["header"] == {"version": 14}
+
+
+def test_parse_kas_follows_includes():
+    files = {
+        "board.yml": "header:\n  version: 14\n  includes:\n    - inc/common.yml\n"
+        "repos:\n  local:\n    path: layers/local\n",
+        "inc/common.yml": "header:\n  version: 14\n  includes: [inc/base.yml]\n"
+        "repos:\n  meta-a:\n    url: git@x:a.git\n    commit: aaa\n",
+        "inc/base.yml": "header:\n  version: 14\nrepos:\n  meta-b:\n    commit: bbb\n"
+        "  meta-a:\n    commit: old\n    branch: devel\n",
+    }
+    loaded = []
+    documents = deps.KasDocuments(lambda p: loaded.append(p) or files.get(p.as_posix(), ""))
+    observed = {"meta-a": "u", "meta-b": "u", "local": "u"}
+    parsed = deps.parse(Path("board.yml"), files["board.yml"], observed, documents)
+    assert parsed["meta-a"].version == "aaa"  # the including file wins
+    assert parsed["meta-a"].repository == "git@x:a.git"
+    assert parsed["meta-b"].version == "bbb"
+    assert "local" not in parsed  # local repos have no commit
+
+    # an include shared by other top-level files is read only once per revision
+    deps.parse(Path("inc/common.yml"), files["inc/common.yml"], observed, documents)
+    assert loaded == [Path("inc/common.yml"), Path("inc/base.yml")]
+
+
+def test_parse_kas_include_cycle_and_missing():
+    files = {
+        "a.yml": "header:\n  version: 14\n  includes: [b.yml, missing.yml]\n"
+        "repos:\n  meta-a:\n    commit: aaa\n",
+        "b.yml": "header:\n  version: 14\n  includes: [a.yml]\nrepos:\n  meta-b:\n"
+        "    commit: bbb\n",
+    }
+    documents = deps.KasDocuments(lambda p: files.get(p.as_posix(), ""))
+    parsed = deps.parse(Path("a.yml"), files["a.yml"], {"meta-a": "u", "meta-b": "u"}, documents)
+    assert {d: parsed[d].version for d in parsed} == {"meta-a": "aaa", "meta-b": "bbb"}
+
+
+def test_parse_yaml_missing_in_revision():
+    assert deps.parse(Path("board.yml"), "", {"dep": "u"}) == {}
@@ -0,0 +1,270 @@
+"""Unit tests for the gira pipeline - upgrades are processed concurrently, yielded in order."""
+
+import asyncio
+import io
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from gira import cache, config, core, formatter, gira, jira, repo
+from test_cache import _git, _upstream
+from test_repo import _commit
+
+
+@pytest.fixture
+def upstreams(tmp_path, monkeypatch) -> dict[str, str]:
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / ".gira_cache")
+    return {
+        name: f"file://{_upstream(tmp_path / name, ['initial', f'fix: {name.upper()}-1'])}/.git"
+        for name in ("a", "b", "c")
+    }
+
+
+def _process(
+    observe: dict[str, str], details: bool = False, history=None, new: str = "v1.0.1", **options
+) -> Iterator[core.Result]:
+    upgrades = [core.Upgrade(name, "v1.0.0", new) for name in observe]
+    conf = config.Config(jira={}, observe=observe, cache=options, history=history)
+    return gira._process(upgrades, {}, conf, False, False, details)
+
+
+def _printed(observe: dict[str, str], **options) -> list[tuple[str, list[str]]]:
+    return [(r.upgrade.name, [t.name for t in r.tickets]) for r in _process(observe, **options)]
+
+
+def test_report_keeps_order_of_upgrades(upstreams, monkeypatch):
+    original = cache.cache
+
+    def slow_first(name, *args, **kwargs):
+        if name == "a":
+            time.sleep(0.5)
+        return original(name, *args, **kwargs)
+
+    monkeypatch.setattr(cache, "cache", slow_first)
+    assert _printed(upstreams, jobs=3) == [("a", ["A-1"]), ("b", ["B-1"]), ("c", ["C-1"])]
+
+
+def test_report_walks_histories_concurrently(upstreams, monkeypatch):
+    original = repo.Repo.commits
+    # passed only by three walks at once - sequential ones break it after the timeout
+    walking = threading.Barrier(3, timeout=10)
+
+    def meeting_commits(self, *args, **kwargs):
+        walking.wait()
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(repo.Repo, "commits", meeting_commits)
+    printed = _printed(upstreams, jobs=3)
+    assert [name for name, _ in printed] == ["a", "b", "c"]
+
+
+def test_results_within_a_running_event_loop(upstreams):
+    async def printed() -> list[tuple[str, list[str]]]:
+        return _printed(upstreams, jobs=3)
+
+    async def first() -> str:
+        results = _process(upstreams, jobs=3)
+        name = next(results).upgrade.name
+        results.close()  # the consumer stops early
+        return name
+
+    assert asyncio.run(printed()) == [("a", ["A-1"]), ("b", ["B-1"]), ("c", ["C-1"])]
+    assert asyncio.run(first()) == "a"
+
+
+def test_report_skips_failed_fetch(upstreams, tmp_path):
+    printed = _printed({**upstreams, "b": f"file://{tmp_path}/missing"}, jobs=3)
+    assert [name for name, _ in printed] == ["a", "c"]
+
+
+def test_results_carry_commits_and_timings(upstreams, tmp_path):
+    (result, *_) = _process(upstreams, jobs=3)
+    assert result.upgrade.new_oid == _git("rev-parse", "v1.0.1", cwd=tmp_path / "a")
+    assert result.upgrade.old_oid == _git("rev-parse", "v1.0.0", cwd=tmp_path / "a")
+    assert {"cache", "messages"} <= set(result.upgrade.timings)
+    assert result.as_dict()["tickets"] == [{"name": "A-1", "url": "", "summary": ""}]
+    # the second time tickets and commits come from the ticket store
+    (again, *_) = _process(upstreams, jobs=3)
+    assert again.upgrade.new_oid == result.upgrade.new_oid
+    assert "messages" not in again.upgrade.timings
+
+
+def test_history_options_reach_the_cached_walk(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / ".gira_cache")
+    a = _upstream(tmp_path / "a", ["initial", "fix: A-1"])
+    _git("checkout", "-qb", "side", "v1.0.0", cwd=a)
+    _commit(a, {"side.txt": "side"}, "fix: A-2")
+    _git("checkout", "-q", "-", cwd=a)
+    _commit(a, {"last.txt": "last"}, "fix: A-3")
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "merge", "-q", "side", "-m", "merge", cwd=a)
+    _git("tag", "v1.1.0", cwd=a)
+    observe = {"a": f"file://{a}/.git"}
+
+    def tickets(**history) -> list[str]:
+        (result,) = _process(observe, history=history, new="v1.1.0")
+        return sorted(t.name for t in result.tickets)
+
+    assert tickets() == ["A-1", "A-2", "A-3"]
+    assert tickets(first_parent=True) == ["A-1", "A-3"]
+    assert tickets(first_parent=True, limit=2) == ["A-3"]  # the merge and its first parent
+
+
+def test_jira_lookups_are_batched_and_concurrent(upstreams, monkeypatch):
+    batches = []
+    looking_up = threading.Event()  # the ticket of a is being looked up
+    overlapped = threading.Event()  # another lookup started meanwhile
+
+    def details(self, names):
+        batches.append(list(names))
+        if "A-1" in names:
+            looking_up.set()
+            assert overlapped.wait(timeout=10), "lookups are serialized"
+        else:
+            overlapped.set()
+        return {name: jira.Ticket(name, summary=f"Fix {name}") for name in names}
+
+    original = repo.Repo.commits
+
+    def commits_after_a(self, *args, **kwargs):
+        if not self.path.name.startswith("a-"):
+            looking_up.wait(timeout=10)  # b and c find their tickets while a looks them up
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(jira.Jira, "get_tickets_details", details)
+    monkeypatch.setattr(repo.Repo, "commits", commits_after_a)
+    results = list(_process(upstreams, details=True, jobs=3))
+    assert [[t.summary for t in r.tickets] for r in results] == [
+        ["Fix A-1"],
+        ["Fix B-1"],
+        ["Fix C-1"],
+    ]
+    assert sorted(name for batch in batches for name in batch) == ["A-1", "B-1", "C-1"]
+    # tickets of upgrades ready at once (here from the ticket store) are looked up together
+    batches.clear()
+    overlapped.set()
+    list(_process(upstreams, details=True, jobs=3))
+    assert batches == [["A-1", "B-1", "C-1"]]
+
+
+def test_first_tags_of_tickets(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / ".gira_cache")
+    a = _upstream(tmp_path / "a", ["initial", "fix: A-1", "fix: A-2", "fix: A-1 again"])
+    (result,) = _process({"a": f"file://{a}/.git"}, new="v1.0.3")
+    first = {ticket: tag for ticket, (tag, _) in result.upgrade.first_tags.items()}
+    assert first == {"A-1": "v1.0.1", "A-2": "v1.0.2"}  # not v1.0.3 they were bumped to
+    assert result.upgrade.first_tags["A-1"][1] == _git("rev-parse", "v1.0.1", cwd=a)
+
+
+def test_results_can_be_abandoned(upstreams):
+    results = _process(upstreams, jobs=3)
+    assert next(results).upgrade.name == "a"
+    results.close()  # the rest is cancelled without errors
+
+
+def test_json_formatters():
+    upgrade = core.Upgrade("a", "v1", "v2", old_oid="1" * 40, new_oid="2" * 40)
+    tickets = [jira.Ticket("A-1", "https://jira/A-1", "Fix")]
+    stream = io.StringIO()
+    fmt = formatter.get_formatter("ndjson", stream)
+    fmt.print(upgrade, tickets)
+    fmt.print(core.Upgrade("b", "v1", "v2"), [])
+    fmt.close()
+    first, second = map(json.loads, stream.getvalue().splitlines())
+    assert first["old_oid"] == "1" * 40
+    assert first["tickets"] == [{"name": "A-1", "url": "https://jira/A-1", "summary": "Fix"}]
+    assert second["name"] == "b" and second["tickets"] == []
+
+    stream = io.StringIO()
+    fmt = formatter.get_formatter("json", stream)
+    fmt.print(upgrade, tickets)
+    assert stream.getvalue() == ""  # written at once when closed
+    fmt.close()
+    assert json.loads(stream.getvalue()) == [first]
+
+
+def test_submit_all_resolves_futures_by_name(upstreams):
+    upgrades = [core.Upgrade(name, "v1.0.0", "v1.0.1") for name in upstreams]
+    futures = cache.submit_all(upgrades, {**upstreams, "b": "file:///nonexistent"}, jobs=3)
+    assert set(futures) == {"a", "b", "c"}
+    assert futures["a"].result().messages("v1.0.0", "v1.0.1") == ["fix: A-1"]
+    assert futures["b"].exception() is not None
+    assert Path(futures["c"].result().path).is_dir()
+    assert re.match(r"c-[0-9a-f]{8}\.git", Path(futures["c"].result().path).name)
+
+
+@pytest.fixture
+def released(tmp_path, monkeypatch) -> config.Config:
+    """Host repository bumping `a` in three commits - tagged r1 after the first, r2 at the end"""
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / ".gira_cache")
+    a = _upstream(tmp_path / "a", ["initial", "fix: A-1", "fix: A-2", "fix: A-3"])
+    host = tmp_path / "host"
+    host.mkdir()
+    _git("init", "-q", cwd=host)
+
+    def manifest(version: str) -> dict[str, str]:
+        return {"west.yml": f"manifest:\n  projects:\n  - name: a\n    revision: {version}\n"}
+
+    _commit(host, manifest("v1.0.0"), "initial")
+    _git("tag", "r0", cwd=host)
+    _commit(host, manifest("v1.0.1"), "bump to 1")
+    _commit(host, {"README.md": "docs"}, "docs")
+    _git("tag", "r1", cwd=host)
+    _commit(host, manifest("v1.0.2"), "bump to 2")
+    _commit(host, manifest("v1.0.3"), "bump to 3")
+    _git("tag", "r2", cwd=host)
+    monkeypatch.chdir(host)
+    return config.Config(jira={}, observe={"a": f"file://{a}/.git"})
+
+
+def _sections(results) -> list[tuple[str, str, list[str]]]:
+    return [
+        (
+            section.split(" ", 1)[-1],
+            f"{r.upgrade.old_version}..{r.upgrade.new_version}",
+            [t.name for t in r.tickets],
+        )
+        for section, r in results
+    ]
+
+
+def test_releases_per_commit(released):
+    assert _sections(gira.releases(released, "r0..r2")) == [
+        ("bump to 1", "v1.0.0..v1.0.1", ["A-1"]),
+        ("bump to 2", "v1.0.1..v1.0.2", ["A-2"]),
+        ("bump to 3", "v1.0.2..v1.0.3", ["A-3"]),
+    ]
+
+
+def test_releases_per_tag(released):
+    assert _sections(gira.releases(released, "r0..", per_tag=True)) == [
+        ("r1", "v1.0.0..v1.0.1", ["A-1"]),
+        ("r2", "v1.0.1..v1.0.3", ["A-2", "A-3"]),
+    ]
+
+
+def test_releases_need_a_range(released):
+    with pytest.raises(ValueError):
+        list(gira.releases(released, "r0"))
+
+
+def test_releases_recognize_kas_files_by_their_commit(released, tmp_path, caplog):
+    a = tmp_path / "a"
+
+    def kas(version: str) -> dict[str, str]:
+        commit = _git("rev-parse", f"{version}^{{commit}}", cwd=a)
+        return {"kas.yml": f"header:\n  version: 14\nrepos:\n  a:\n    commit: {commit}\n"}
+
+    _commit(Path("."), kas("v1.0.0"), "add kas")
+    _git("tag", "r3", cwd=Path("."))
+    _commit(Path("."), kas("v1.0.1"), "kas bump")
+    Path("kas.yml").unlink()
+    _commit(Path("."), {}, "drop kas")
+    # the file is not in the working tree anymore
+    ((section, result),) = gira.releases(released, "r3..")
+    assert section.endswith("kas bump") and [t.name for t in result.tickets] == ["A-1"]
+    assert "Parsing" not in caplog.text
@@ -0,0 +1,87 @@
+"""Import-time budget of gira - a pre-commit hook run must start fast.
+
+Every check runs a fresh interpreter so modules imported by other tests do not count.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+HEAVY = ("jira", "requests", "yaml", "packaging", "asyncio")
+BUDGET = 0.1  # seconds spent importing modules by a pre-commit hook run with no dependency change
+# a pre-commit hook run without any change of a dependency file
+HOOK_RUN = (
+    "import sys\n"
+    "from gira.__main__ import main\n"
+    "sys.argv = ['gira', '-c', 'pyproject.toml']\n"
+    "assert main() == 0"
+)
+
+
+def _python(code: str, cwd: Path = Path(".")) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def _loaded(code: str, cwd: Path = Path(".")) -> list[str]:
+    check = f"import sys\n{code}\nprint([m for m in {HEAVY!r} if m in sys.modules])"
+    return eval(_python(check, cwd).stdout.strip().splitlines()[-1])
+
+
+def _import_time(code: str, cwd: Path) -> float:
+    """Seconds spent importing by `code` - all top-level imports but those of the interpreter"""
+
+    def total(code: str) -> int:
+        columns = [line.split("|") for line in _python(code, cwd).stderr.splitlines()]
+        return sum(
+            int(cumulative)
+            for _, cumulative, name in (c for c in columns if len(c) == 3)
+            if cumulative.strip().isdigit() and not name.startswith("  ")  # nested imports
+        )
+
+    return (total(code) - total("pass")) / 1e6  # microseconds
+
+
+@pytest.fixture
+def hook_repo(tmp_path) -> Path:
+    """Repository with a staged change of no dependency file"""
+
+    def git(*args: str) -> None:
+        subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+            cwd=tmp_path,
+            check=True,
+            capture_output=True,
+        )
+
+    git("init", "-q")
+    (tmp_path / "pyproject.toml").write_text(
+        '[project]\ndependencies = ["dep1==1.0.0"]\n\n'
+        '[tool.gira.observe]\ndep1 = "file:///nonexistent/dep1.git"\n'
+    )
+    (tmp_path / "README.md").write_text("a")
+    git("add", ".")
+    git("commit", "-qm", "initial")
+    (tmp_path / "README.md").write_text("b")
+    git("add", "README.md")
+    return tmp_path
+
+
+def test_import_does_not_load_heavy_modules():
+    assert _loaded("import gira.__main__") == []
+
+
+def test_import_time_budget(hook_repo):
+    # everything the run imports counts - gira.__main__ itself loads gira.gira only when it runs
+    assert min(_import_time(HOOK_RUN, hook_repo) for _ in range(3)) < BUDGET
+
+
+def test_commit_format_run_without_heavy_modules(hook_repo):
+    assert _loaded(HOOK_RUN, hook_repo) == []
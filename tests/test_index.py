@@ -0,0 +1,59 @@
+"""Unit tests for gira.index - the ticket index answering where tickets were shipped."""
+
+from gira import core, index, jira
+
+
+def _result(name: str, old: str, new: str, *tickets: str) -> core.Result:
+    return core.Result(
+        core.Upgrade(name, old, new, new_oid="1" * 40), list(map(jira.Ticket, tickets))
+    )
+
+
+def test_find_first_version_per_dependency(tmp_path):
+    path = tmp_path / index.FILENAME
+    index.record(path, [("r2", _result("a", "v1.1.0", "v1.10.0", "A-1", "A-2"))], "host")
+    index.record(path, [("r1", _result("a", "v1.0.0", "v1.2.0", "A-1"))], "host")
+    index.record(path, [("", _result("b", "main", "feature", "A-1"))], "host")
+    index.record(path, [("r1", _result("a", "v1.0.0", "v1.2.0", "A-1"))], "host")  # known already
+
+    shipments = index.find(path, "A-1")
+    # versions are compared as versions (v1.2.0 < v1.10.0) - not in the order of recording
+    assert [(s.dependency, s.version, s.host) for s in shipments] == [
+        ("a", "v1.2.0", "r1"),
+        ("a", "v1.10.0", "r2"),
+        ("b", "feature", ""),
+    ]
+    assert shipments[0].oid == "1" * 40
+    assert [s.version for s in index.find(path, "A-2")] == ["v1.10.0"]
+    assert index.find(path, "A-3") == []
+
+
+def test_find_per_host_repository(tmp_path):
+    path = tmp_path / index.FILENAME
+    index.record(path, [("", _result("a", "v1.0.0", "v1.1.0", "A-1"))], "git@host:first.git")
+    index.record(path, [("", _result("a", "v1.0.0", "v1.2.0", "A-1"))], "/work/second")
+    assert [s.version for s in index.find(path, "A-1", "/work/second")] == ["v1.2.0"]
+    assert index.find(path, "A-1", "/work/third") == []
+    assert [s.repository for s in index.find(path, "A-1")] == ["git@host:first.git", "/work/second"]
+
+
+def test_find_without_index(tmp_path):
+    assert index.find(tmp_path / index.FILENAME, "A-1") == []
+    index.record(tmp_path / index.FILENAME, [], "host")  # nothing to record creates nothing
+    assert not (tmp_path / index.FILENAME).exists()
+
+
+def test_record_failure_is_not_fatal(tmp_path, caplog):
+    (tmp_path / index.FILENAME).write_text("not a database")
+    index.record(tmp_path / index.FILENAME, [("", _result("a", "v1", "v2", "A-1"))], "host")
+    assert "cannot be updated" in caplog.text
+
+
+def test_record_first_tags(tmp_path):
+    path = tmp_path / index.FILENAME
+    result = _result("a", "v1.0.0", "v1.5.0", "A-1", "A-2")
+    result.upgrade.first_tags = {"A-1": ("v1.2.0", "2" * 40)}
+    index.record(path, [("", result)], "host")
+    (a1,) = index.find(path, "A-1")
+    assert (a1.version, a1.oid) == ("v1.2.0", "2" * 40)
+    assert [s.version for s in index.find(path, "A-2")] == ["v1.5.0"]
@@ -0,0 +1,150 @@
+"""Unit tests for gira.jira - ticket extraction and looking up ticket details.
+
+JIRA itself is replaced by the local HTTP stand-in from ``jira_standin.py``.
+"""
+
+import pytest
+
+from gira import jira
+from jira_standin import JiraStandIn
+
+
+@pytest.fixture
+def standin():
+    with JiraStandIn({f"OCD-{i}": f"Summary {i}" for i in range(1, 121)}) as server:
+        yield server
+
+
+def test_get_tickets_details_searches_in_chunks(standin):
+    client = jira.Jira(url=standin.url, token="token")
+    names = [f"OCD-{i}" for i in range(1, 121)]
+    tickets = client.get_tickets_details(names)
+    assert list(tickets) == names
+    assert tickets["OCD-7"].summary == "Summary 7"
+    assert tickets["OCD-7"].url == f"{standin.url}/browse/OCD-7"
+    # 120 tickets need 3 searches instead of 120 issue requests
+    assert len(standin.searches()) == 3
+    assert not [r for r in standin.requests if r.startswith("/rest/api/2/issue/")]
+
+
+def test_get_tickets_details_reports_missing(standin, caplog):
+    client = jira.Jira(url=standin.url, token="token")
+    tickets = client.get_tickets_details(["OCD-1", "UTF-8", "OCD-2", "OCD-1"])
+    assert list(tickets) == ["OCD-1", "OCD-2"]
+    assert "UTF-8" in caplog.text
+    assert len(standin.searches()) == 1
+
+
+def test_get_tickets_details_without_connection():
+    client = jira.Jira(url="https://jira.example.com")
+    tickets = client.get_tickets_details(["OCD-1"])
+    assert tickets["OCD-1"].url == "https://jira.example.com/browse/OCD-1"
+    assert tickets["OCD-1"].summary == ""
+
+
+def test_get_tickets_details_of_unreachable_server():
+    # nothing listens on the discard port - tickets keep their URLs, the run goes on
+    client = jira.Jira(url="http://127.0.0.1:9", token="token")
+    tickets = client.get_tickets_details(["A-1"])
+    assert tickets == {"A-1": jira.Ticket("A-1", url="http://127.0.0.1:9/browse/A-1")}
+
+
+def test_ticket_pattern_prefix():
+    assert jira.extract_ticket_names("fix ABC-1 and DH-22") == ["ABC-1", "DH-22"]
+    assert jira.extract_ticket_names("ABC-1 DH-22", jira.ticket_pattern("DH")) == ["DH-22"]
+    pattern = jira.ticket_pattern(["DH", "OCD"])
+    assert jira.extract_ticket_names("ABC-1 DH-22 OCD-3", pattern) == ["DH-22", "OCD-3"]
+
+
+def test_ticket_cache_serves_repeated_lookups(standin, tmp_path):
+    path = tmp_path / "jira.json"
+    jira.Jira(url=standin.url, token="token", cache_path=path).get_tickets_details(["OCD-1"])
+    requests = len(standin.requests)
+    tickets = jira.Jira(url=standin.url, token="token", cache_path=path).get_tickets_details(
+        ["OCD-1"]
+    )
+    assert tickets["OCD-1"].summary == "Summary 1"
+    assert len(standin.requests) == requests  # not even connected
+
+
+def test_ticket_cache_remembers_unknown_tickets(standin, tmp_path):
+    path = tmp_path / "jira.json"
+    jira.Jira(url=standin.url, token="token", cache_path=path).get_tickets_details(["UTF-8"])
+    searches = len(standin.searches())
+    client = jira.Jira(url=standin.url, token="token", cache_path=path)
+    assert client.get_tickets_details(["UTF-8", "OCD-2"]) == {"OCD-2": jira.Ticket("OCD-2")}
+    assert standin.searches()[searches:] and "UTF-8" not in standin.searches()[-1]
+
+
+def test_ticket_cache_skips_failed_searches(standin, tmp_path):
+    path = tmp_path / "jira.json"
+    standin.search_status = 500
+    tickets = jira.Jira(url=standin.url, token="token", cache_path=path).get_tickets_details(
+        ["OCD-1"]
+    )
+    assert tickets["OCD-1"].summary == ""
+    standin.search_status = None  # recovered - the ticket is not remembered as unknown
+    tickets = jira.Jira(url=standin.url, token="token", cache_path=path).get_tickets_details(
+        ["OCD-1"]
+    )
+    assert tickets["OCD-1"].summary == "Summary 1"
+
+
+def test_ticket_cache_expires_and_evicts(standin, tmp_path):
+    path = tmp_path / "jira.json"
+    client = jira.Jira(url=standin.url, token="token", cache_path=path, ttl=0, cache_size=2)
+    client.get_tickets_details(["OCD-1", "OCD-2", "OCD-3"])
+    assert len(standin.searches()) == 1
+    client.get_tickets_details(["OCD-1"])
+    assert len(standin.searches()) == 2  # expired
+    cache = jira.TicketCache(path, ttl=3600, size=2)
+    keys = [f"{standin.url}/browse/{name}" for name in ("OCD-1", "OCD-2", "OCD-3")]
+    assert cache.get(keys[0]) is not None
+    assert len([key for key in keys if cache.get(key, stale=True)]) == 2
+
+
+def test_ticket_cache_is_kept_per_server(standin, tmp_path):
+    path = tmp_path / "jira.json"
+    jira.Jira(url=standin.url, token="token", cache_path=path).get_tickets_details(["OCD-1"])
+    other = jira.Jira(url="https://jira.example.com", cache_path=path, offline=True)
+    assert other.get_tickets_details(["OCD-1"])["OCD-1"].summary == ""
+
+
+def test_offline_uses_only_the_cache(standin, tmp_path):
+    path = tmp_path / "jira.json"
+    jira.Jira(url=standin.url, token="token", cache_path=path, ttl=0).get_tickets_details(["OCD-1"])
+    requests = len(standin.requests)
+    client = jira.Jira(url=standin.url, token="token", cache_path=path, ttl=0, offline=True)
+    tickets = client.get_tickets_details(["OCD-1", "OCD-2"])
+    assert len(standin.requests) == requests
+    assert tickets["OCD-1"].summary == "Summary 1"  # stale entries are fine offline
+    assert tickets["OCD-2"].summary == ""
+    assert tickets["OCD-2"].url == f"{standin.url}/browse/OCD-2"
+
+
+def test_one_client_and_kept_alive_connections(standin):
+    client = jira.Jira(url=standin.url, token="token", jobs=2)
+    client.get_tickets_details([f"OCD-{i}" for i in range(1, 101)])
+    client.get_tickets_details([f"OCD-{i}" for i in range(101, 121)])
+    assert standin.requests.count("/rest/api/2/serverInfo") == 1
+    assert len(standin.searches()) == 3
+    # the searches reuse pooled connections instead of opening one per request
+    assert len(standin.connections) <= 1 + 2  # the handshake + one per job
+
+
+def test_only_refused_searches_are_split(caplog):
+    issues = {f"OCD-{i}": f"Summary {i}" for i in range(1, 9)}
+    with JiraStandIn(issues, strict=True) as server:
+        client = jira.Jira(url=server.url, token="token")
+        tickets = client.get_tickets_details(["OCD-1", "OCD-2", "UTF-8", "OCD-3"])
+        assert list(tickets) == ["OCD-1", "OCD-2", "OCD-3"]
+        assert "Tickets not found in Jira: UTF-8" in caplog.text
+        assert len(server.searches()) > 1  # the unknown key was isolated
+
+        server.search_status = 500
+        server.requests.clear()
+        tickets = client.get_tickets_details([f"OCD-{i}" for i in range(4, 9)])
+        assert len(server.searches()) == 1  # an outage is not split into 2n-1 searches
+        assert list(tickets) == [f"OCD-{i}" for i in range(4, 9)]  # not reported as unknown
+        assert tickets["OCD-4"].url == f"{server.url}/browse/OCD-4"
+        assert "Jira search failed" in caplog.text
@@ -0,0 +1,281 @@
+"""Unit tests for gira.repo - diffing the host repository and walking dependency history.
+
+Repositories are created on the fly with the git binary in temporary directories.
+"""
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from gira import repo
+
+
+def _git(*args: str, cwd: Path) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def _commit(path: Path, files: dict[str, str], message: str) -> str:
+    for name, content in files.items():
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_text(content)
+    _git("add", ".", cwd=path)
+    _git("commit", "-qm", message, cwd=path)
+    return _git("rev-parse", "HEAD", cwd=path)
+
+
+@pytest.fixture
+def host(tmp_path, monkeypatch):
+    path = tmp_path / "host"
+    path.mkdir()
+    _git("init", "-q", cwd=path)
+    _commit(path, {"pyproject.toml": "a", "README.md": "a", "west.yml": "a"}, "initial")
+    monkeypatch.chdir(path)
+    return path
+
+
+def test_identity(host):
+    assert repo.identity(host) == str(host.resolve())  # the working tree
+    _git("remote", "add", "upstream", "https://example.com/upstream.git", cwd=host)
+    assert repo.identity(host) == "https://example.com/upstream.git"
+    _git("remote", "add", "origin", "git@example.com:host.git", cwd=host)
+    assert repo.identity(host) == "git@example.com:host.git"
+
+
+def test_changed_files_prefers_staged_changes(host):
+    (host / "pyproject.toml").write_text("b")
+    (host / "west.yml").write_text("b")
+    _git("add", "pyproject.toml", cwd=host)
+    repository = repo.Repo(Path("."))
+    assert repository.changed_files() == [Path("pyproject.toml")]
+
+
+def test_changed_files_unstaged(host):
+    (host / "west.yml").write_text("b")
+    repository = repo.Repo(Path("."))
+    assert repository.changed_files() == [Path("west.yml")]
+
+
+def test_changed_files_against_tag(host):
+    _git("tag", "v1.0.0", cwd=host)
+    _commit(host, {"README.md": "b"}, "docs")
+    repository = repo.Repo(Path("."), ref="v1.0.0")
+    assert repository.ref == "refs/tags/v1.0.0"
+    assert repository.changed_files() == [Path("README.md")]
+
+
+def test_diff_is_computed_once(host, monkeypatch):
+    (host / "west.yml").write_text("b")
+    repository = repo.Repo(Path("."))
+    calls = []
+    diff = repository.repo.diff
+    monkeypatch.setattr(
+        type(repository.repo), "diff", lambda self, *a, **kw: calls.append(a) or diff(*a, **kw)
+    )
+    repository.changed_files()
+    repository.changed_files()
+    repository.submodule_change(Path("west.yml"))
+    assert len(calls) == 1
+
+
+def test_submodule_change(host, tmp_path):
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    _git("init", "-q", cwd=sub)
+    first = _commit(sub, {"a.txt": "a"}, "initial")
+    second = _commit(sub, {"a.txt": "b"}, "feat: OCD-1")
+    _git("-c", "protocol.file.allow=always", "submodule", "add", "-q", str(sub), "sub", cwd=host)
+    _git("-C", "sub", "checkout", "-q", first, cwd=host)
+    _git("add", "sub", cwd=host)
+    _git("commit", "-qm", "add submodule", cwd=host)
+    _git("-C", "sub", "checkout", "-q", second, cwd=host)
+    _git("add", "sub", cwd=host)
+
+    repository = repo.Repo(Path("."))
+    assert repository.has_submodules
+    assert repository.changed_files() == [Path("sub")]
+    assert repository.submodule_change(Path("sub")) == (first, second)
+
+    # unstaged submodule change is found by the pathspec limited diff too
+    _git("reset", "-q", cwd=host)
+    repository = repo.Repo(Path("."), pathspecs=["pyproject.toml"])
+    assert repository.changed_files() == [Path("sub")]
+    assert repository.submodule_change(Path("sub")) == (first, second)
+
+
+@pytest.mark.parametrize("staged", [False, True])
+def test_changed_files_limited_by_pathspecs(host, staged):
+    (host / "README.md").write_text("b")
+    (host / "pyproject.toml").write_text("b")
+    (host / "deep/down").mkdir(parents=True)
+    (host / "deep/down/west-x.yml").write_text("a")
+    _git("add", "deep", cwd=host)
+    _git("commit", "-qm", "deep", cwd=host)
+    (host / "deep/down/west-x.yml").write_text("b")
+    if staged:
+        _git("add", ".", cwd=host)
+    repository = repo.Repo(Path("."), pathspecs=["pyproject.toml", "west*.yml"])
+    assert sorted(repository.changed_files()) == [
+        Path("deep/down/west-x.yml"),
+        Path("pyproject.toml"),
+    ]
+
+
+def test_pathspecs_with_invalid_ref(host):
+    with pytest.raises(RuntimeError):
+        repo.Repo(Path("."), ref="nope", pathspecs=["pyproject.toml"]).changed_files()
+
+
+@pytest.fixture
+def merged(tmp_path):
+    """v1.0.0 -> (feature: F-1, F-2 merged) + main: M-1 -> v1.1.0"""
+    path = tmp_path / "merged"
+    path.mkdir()
+    _git("init", "-q", "-b", "main", cwd=path)
+    _commit(path, {"a.txt": "a"}, "initial")
+    _git("tag", "v1.0.0", cwd=path)
+    _git("checkout", "-qb", "feature", cwd=path)
+    _commit(path, {"f.txt": "1"}, "feat: F-1")
+    _commit(path, {"f.txt": "2"}, "feat: F-2")
+    _git("checkout", "-q", "main", cwd=path)
+    _commit(path, {"a.txt": "b"}, "fix: M-1")
+    _git("merge", "-q", "--no-ff", "-m", "merge feature", "feature", cwd=path)
+    _git("tag", "v1.1.0", cwd=path)
+    return repo.Repo(path, ref="HEAD")
+
+
+def test_messages_walks_the_range(merged):
+    messages = merged.messages("v1.0.0", "v1.1.0")
+    assert messages[0] == "merge feature"
+    assert sorted(messages[1:]) == ["feat: F-1", "feat: F-2", "fix: M-1"]
+    # topological order - F-2 always comes before its parent F-1
+    assert messages.index("feat: F-2") < messages.index("feat: F-1")
+    assert merged.messages("v1.1.0", "v1.1.0") == []
+
+
+def test_messages_first_parent(merged):
+    assert merged.messages("v1.0.0", "v1.1.0", first_parent=True) == ["merge feature", "fix: M-1"]
+
+
+def test_messages_limit(merged):
+    assert len(merged.messages("v1.0.0", "v1.1.0", limit=2)) == 2
+    assert len(merged.messages("v1.0.0", "v1.1.0", limit=None)) == 4
+
+
+def test_messages_from_a_side_branch(merged):
+    # the old revision is not on the first-parent line - only commits not reachable from it count
+    assert sorted(merged.messages("feature", "v1.1.0")) == ["fix: M-1", "merge feature"]
+
+
+def test_messages_downgrade_by_ancestry(tmp_path, monkeypatch):
+    path = tmp_path / "skewed"
+    path.mkdir()
+    _git("init", "-q", cwd=path)
+    _commit(path, {"a.txt": "a"}, "initial")
+    # a commit dated in the past is still newer in history - commit times must not decide
+    monkeypatch.setenv("GIT_COMMITTER_DATE", "2000-01-01T00:00:00")
+    _commit(path, {"a.txt": "b"}, "fix: S-1")
+    repository = repo.Repo(path, ref="HEAD")
+    assert repository.resolve("HEAD").commit_time < repository.resolve("HEAD~1").commit_time
+    assert repository.messages("HEAD~1", "HEAD") == ["fix: S-1"]
+    assert repository.messages("HEAD", "HEAD~1") == []
+
+
+def test_history_lists_commits_changing_pathspecs(host):
+    bump = _commit(host, {"west.yml": "b"}, "bump")
+    _commit(host, {"README.md": "b"}, "docs")
+    _git("checkout", "-qb", "feature", cwd=host)
+    _commit(host, {"pyproject.toml": "b"}, "feature bump")
+    _git("checkout", "-q", "-", cwd=host)
+    _git("merge", "-q", "--no-ff", "-m", "merge", "feature", cwd=host)
+    merge = _git("rev-parse", "HEAD", cwd=host)
+
+    repository = repo.Repo(host, ref="HEAD", pathspecs=["west.yml", "pyproject.toml"])
+    history = repository.history(bump + "~1", "HEAD")
+    # the merge brings the feature branch change to the mainline, docs change nothing observed
+    assert [(commit, list(changes)) for commit, changes in history] == [
+        (bump, ["west.yml"]),
+        (merge, ["pyproject.toml"]),
+    ]
+    old_id, new_id = history[0][1]["west.yml"]
+    assert repository.get_blob_content(old_id) == "a"
+    assert repository.get_blob_content(new_id) == "b"
+    assert repository.get_content(bump, Path("west.yml")) == "b"
+    assert len(repository.mainline(bump + "~1", "HEAD")) == 3
+
+
+@pytest.mark.parametrize(
+    "version,normalized",
+    [
+        ("v1.13.0", "1.13"),
+        ("1.13.0", "1.13"),
+        ("1.13", "1.13"),
+        ("v1.13.0-rc.1", "1.13rc1"),
+        ("1.13.0rc1", "1.13rc1"),
+        ("v1.13.0.rc.1", "1.13rc1"),
+        ("v1.13.1", "1.13.1"),
+        ("main", None),
+    ],
+)
+def test_normalize_version(version, normalized):
+    assert repo.normalize_version(version) == normalized
+
+
+@pytest.fixture
+def tagged(tmp_path):
+    path = tmp_path / "tagged"
+    path.mkdir()
+    _git("init", "-q", cwd=path)
+    commits = {}
+    for tag in ["v0.9.0", "v1.0.0", "1.2.0", "v1.3.0-rc.1", "v2.0.0"]:
+        commits[tag] = _commit(path, {"a.txt": tag}, f"release {tag}")
+        _git("tag", tag, cwd=path)
+    _git("tag", "-a", "-m", "annotated", "v2.0.1", cwd=path)
+    repository = repo.Repo(path, ref="HEAD")
+    repository.tag_versions = repository.tag_index()
+    return repository, commits
+
+
+def test_tag_index(tagged):
+    repository, commits = tagged
+    assert repository.tag_versions["1.3rc1"] == ("v1.3.0-rc.1", commits["v1.3.0-rc.1"])
+    assert repository.tag_versions["2.0.1"] == ("v2.0.1", commits["v2.0.0"])  # peeled
+
+
+@pytest.mark.parametrize(
+    "revision,tag",
+    [
+        ("1.0.0", "v1.0.0"),  # equal versions resolve to the tag whatever its spelling
+        ("v1.2.0", "1.2.0"),
+        ("1.2", "1.2.0"),
+        ("1.3.0rc1", "v1.3.0-rc.1"),
+        ("v^1.0.0", "1.2.0"),  # highest matching release, pre-releases only if asked for
+        ("^0.9.0", "v0.9.0"),
+        ("~1.2.0", "1.2.0"),
+        ("^2.0.0", "v2.0.0"),  # both v2.0.0 and annotated v2.0.1 are on the same commit
+    ],
+)
+def test_resolve_versions_by_tag_index(tagged, revision, tag):
+    repository, commits = tagged
+    assert str(repository.resolve(revision).id) == commits[tag]
+
+
+def test_range_of_constraints_starts_at_the_lowest_match(tagged):
+    repository, commits = tagged
+    old, new = repository.resolve_range("^1.0.0", "^1.2.0")
+    assert (str(old.id), str(new.id)) == (commits["v1.0.0"], commits["1.2.0"])
+    assert repository.messages("^1.0.0", "^1.2.0") == ["release 1.2.0"]
+
+
+def test_resolve_without_tag_index(tagged):
+    repository, commits = tagged
+    repository.tag_versions = None
+    assert str(repository.resolve("v1.3.0.rc.1").id) == commits["v1.3.0-rc.1"]
+    with pytest.raises(KeyError):
+        repository.resolve("1.0.0")
@@ -0,0 +1,77 @@
+"""Unit tests for gira.timing - recording and reporting durations of stages."""
+
+import io
+import json
+import threading
+
+import pytest
+
+from gira import timing
+
+
+@pytest.fixture(autouse=True)
+def recording():
+    timing.enable()
+    yield
+    timing.disable()
+
+
+def test_span_is_a_noop_when_disabled():
+    timing.disable()
+    with timing.span("diff"):
+        pass
+    assert timing.spans() == []
+
+
+def _fetch(dependency: str) -> None:
+    with timing.span("fetch", dependency=dependency):
+        pass
+
+
+def test_spans_of_all_threads():
+    with timing.span("cache"):
+        threads = [threading.Thread(target=_fetch, args=(n,)) for n in ("a", "b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    *fetches, outer = timing.spans()
+    assert sorted(s.args["dependency"] for s in fetches) == ["a", "b"]
+    assert len({s.thread for s in fetches}) == 2 and outer.name == "cache"
+    assert all(outer.start <= s.start and s.duration <= outer.duration for s in fetches)
+
+
+def test_span_records_failing_block():
+    with pytest.raises(KeyError):
+        with timing.span("messages", dependency="a"):
+            raise KeyError("v1.0.0")
+    assert [s.name for s in timing.spans()] == ["messages"]
+
+
+def test_summary():
+    for dependency in ("a", "a", "b"):
+        with timing.span("messages", dependency=dependency):
+            pass
+    with timing.span("diff"):
+        pass
+    stream = io.StringIO()
+    timing.summary(stream)
+    header, *rows = stream.getvalue().splitlines()
+    assert header.split() == ["stage", "dependency", "count", "total", "max"]
+    assert sorted(row.split()[:-2] for row in rows) == [
+        ["diff", "1"],
+        ["messages", "a", "2"],
+        ["messages", "b", "1"],
+    ]
+
+
+def test_dump(tmp_path):
+    with timing.span("jira.search", keys=3):
+        pass
+    timing.dump(tmp_path / "trace.json")
+    (event,) = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert event["name"] == "jira.search" and event["ph"] == "X" and event["args"] == {"keys": 3}
+
+    timing.dump(tmp_path / "spans.json", "json")
+    (span,) = json.loads((tmp_path / "spans.json").read_text())
+    assert span["name"] == "jira.search" and span["duration"] >= 0